@@ -0,0 +1,201 @@
+from typing import TYPE_CHECKING, Callable, Sequence
+from BaseClasses import CollectionState, Location
+from .Items import category_counter_name
+from .Requires import RequiresItem, RequiresFunction, RequiresAnd, RequiresOr, RequiresNot, RequiresConstant, RequiresNode
+from .Rules import build_requires_tree, compile_requires_node, resolve_item_count, is_category_defined
+
+try:
+    import numpy as np
+except ImportError: # numpy is optional, without it every location is simply checked on its own
+    np = None
+
+if TYPE_CHECKING:
+    from . import ManualWorld
+
+######################
+# Batch rule evaluation
+######################
+#
+# The requires of every location are lowered into flat arrays, so all of a player's locations can be checked
+# against one CollectionState with a handful of numpy operations:
+#  - a count vector holds the state's count of every item and category counter that any rule reads
+#  - each item/category requirement is a row (column in the count vector, needed count), checked all at once
+#  - AND/OR/NOT nodes are grouped by height and reduced level by level with logical_and/or.reduceat
+# Function calls can't be lowered, so they are evaluated one by one in python and fed in like requirements,
+# and locations using the legacy dict form of requires, or whose rule a hook replaced after set_rules, fall back to their own access rule.
+
+class BatchRules:
+    def __init__(self, world: "ManualWorld"):
+        self.world = world
+        self.player = world.player
+        self.locations: list[Location] = list(world.multiworld.get_locations(world.player))
+
+        self.keys: list[str] = [] # state entries read by the requirements, in count vector order
+        self._key_columns: dict[str, int] = {}
+        self._requirement_columns: list[int] = []
+        self._requirement_counts: list[int] = []
+        self._functions: list[Callable[[CollectionState], bool]] = []
+        self._nodes: list[tuple[type, list[tuple[str, int]]]] = []
+        self._node_heights: list[int] = []
+        self._lowered: dict[RequiresNode, tuple[str, int]] = {}
+
+        roots = []
+        fallback_locations = []
+        for index, location in enumerate(self.locations):
+            areas = world.rule_areas.get(location, ())
+
+            if any(not isinstance(area["requires"], str) for area in areas) or location.access_rule is not world.installed_rules.get(location):
+                fallback_locations.append(index)
+                roots.append(("constant", 1))
+                continue
+
+            trees = [build_requires_tree(world, world.multiworld, self.player, area["requires"], area) for area in areas]
+            if not trees:
+                roots.append(("constant", 1))
+            elif len(trees) == 1:
+                roots.append(self._lower(trees[0], areas[0]))
+            else:
+                roots.append(self._lower(RequiresAnd(tuple(trees)), areas[0]))
+
+        # slots of the value vector: the two constants, then requirements, then functions, then nodes by height
+        self._requirement_start = 2
+        self._function_start = self._requirement_start + len(self._requirement_columns)
+        node_start = self._function_start + len(self._functions)
+
+        node_order = sorted(range(len(self._nodes)), key=lambda node: self._node_heights[node])
+        node_slots = [0] * len(self._nodes)
+        for position, node in enumerate(node_order):
+            node_slots[node] = node_start + position
+
+        def slot(ref: tuple[str, int]) -> int:
+            kind, index = ref
+            if kind == "constant":
+                return index
+            if kind == "requirement":
+                return self._requirement_start + index
+            if kind == "function":
+                return self._function_start + index
+            return node_slots[index]
+
+        self._slot_count = node_start + len(self._nodes)
+        self._levels = []
+
+        for height in sorted(set(self._node_heights)):
+            level = {}
+            for node in node_order:
+                if self._node_heights[node] != height:
+                    continue
+
+                node_type, children = self._nodes[node]
+                slots, child_slots, offsets = level.setdefault(node_type, ([], [], []))
+                slots.append(node_slots[node])
+                offsets.append(len(child_slots))
+                child_slots.extend(slot(child) for child in children)
+
+            self._levels.append({
+                node_type: (np.array(slots, dtype=np.intp), np.array(child_slots, dtype=np.intp), np.array(offsets, dtype=np.intp))
+                for node_type, (slots, child_slots, offsets) in level.items()
+            })
+
+        self._requirement_columns = np.array(self._requirement_columns, dtype=np.intp)
+        self._requirement_counts = np.array(self._requirement_counts, dtype=np.int64)
+        self._roots = np.array([slot(root) for root in roots], dtype=np.intp)
+        self._fallback_locations = fallback_locations
+
+        regions = list(dict.fromkeys(location.parent_region for location in self.locations))
+        region_indexes = {region: index for index, region in enumerate(regions)}
+        self._regions = regions
+        self._location_regions = np.array([region_indexes[location.parent_region] for location in self.locations], dtype=np.intp)
+
+    def _lower(self, node: RequiresNode, area: dict) -> tuple[str, int]:
+        if node in self._lowered:
+            return self._lowered[node]
+
+        if isinstance(node, RequiresConstant):
+            ref = ("constant", int(node.value))
+        elif isinstance(node, RequiresItem):
+            ref = self._lower_requirement(node)
+        elif isinstance(node, RequiresFunction):
+            ref = ("function", len(self._functions))
+            self._functions.append(compile_requires_node(self.world, self.world.multiworld, self.player, node, area))
+        else:
+            children = [node.child] if isinstance(node, RequiresNot) else node.children
+            lowered_children = [self._lower(child, area) for child in children]
+            height = 1 + max((self._node_heights[index] for kind, index in lowered_children if kind == "node"), default=0)
+
+            ref = ("node", len(self._nodes))
+            self._nodes.append((type(node), lowered_children))
+            self._node_heights.append(height)
+
+        self._lowered[node] = ref
+        return ref
+
+    def _lower_requirement(self, node: RequiresItem) -> tuple[str, int]:
+        if node.category:
+            # same as the compiled rule, a category that no item belongs to is never satisfied
+            if not is_category_defined(self.world, node.name):
+                return ("constant", 0)
+
+            key = category_counter_name(node.name)
+            _, available_count = self.world.get_category_index().get(node.name, ((), 0))
+        else:
+            key = node.name
+            available_count = self.world.get_item_counts().get(node.name, 0)
+
+        if key not in self._key_columns:
+            self._key_columns[key] = len(self.keys)
+            self.keys.append(key)
+
+        self._requirement_columns.append(self._key_columns[key])
+        self._requirement_counts.append(resolve_item_count(node.count, available_count))
+        return ("requirement", len(self._requirement_counts) - 1)
+
+    def evaluate(self, state: CollectionState) -> "np.ndarray":
+        """Return a boolean array telling which of self.locations can be reached with this state"""
+        prog_items = state.prog_items[self.player]
+        counts = np.fromiter((prog_items.get(key, 0) for key in self.keys), dtype=np.int64, count=len(self.keys))
+
+        values = np.empty(self._slot_count, dtype=bool)
+        values[0] = False
+        values[1] = True
+        values[self._requirement_start:self._function_start] = counts[self._requirement_columns] >= self._requirement_counts
+
+        for index, function in enumerate(self._functions):
+            values[self._function_start + index] = function(state)
+
+        for level in self._levels:
+            for node_type, (slots, child_slots, offsets) in level.items():
+                if node_type is RequiresAnd:
+                    values[slots] = np.logical_and.reduceat(values[child_slots], offsets)
+                elif node_type is RequiresOr:
+                    values[slots] = np.logical_or.reduceat(values[child_slots], offsets)
+                else:
+                    values[slots] = np.logical_not(values[child_slots])
+
+        region_reachable = np.fromiter((region.can_reach(state) for region in self._regions), dtype=bool, count=len(self._regions))
+        mask = values[self._roots] & region_reachable[self._location_regions]
+
+        for index in self._fallback_locations:
+            mask[index] = self.locations[index].can_reach(state)
+
+        return mask
+
+
+def get_reachable_locations_mask(world: "ManualWorld", state: CollectionState) -> tuple[list[Location], Sequence[bool]]:
+    """Check every location of a world against one state at once.\n
+    Returns the world's locations and, in the same order, whether each can be reached.
+    The mask is a numpy array when numpy is installed, and a list otherwise.
+    """
+    if np is None:
+        locations = list(world.multiworld.get_locations(world.player))
+        return locations, [location.can_reach(state) for location in locations]
+
+    batch_rules = world.batch_rules
+    if batch_rules is None: # lowered on first use, and again whenever the item pool changed since
+        batch_rules = BatchRules(world)
+
+        # don't keep rules whose all/half/% counts were resolved before the item pool exists
+        if world.get_item_counts():
+            world.batch_rules = batch_rules
+
+    return batch_rules.locations, batch_rules.evaluate(state)
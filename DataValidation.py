@@ -1,206 +1,154 @@
 import logging
-import re
-import json
+from collections import Counter
+from typing import Iterator, Optional
 from worlds.AutoWorld import World
 from BaseClasses import MultiWorld, ItemClassification
+from .Requires import tokenize_requires, iter_requires_items, token_function
 
 
 class ValidationError(Exception):
     pass
 
+class DataValidationIndex():
+    """The names, categories and regions of the DataValidation tables, read in one pass over each table so every check can look them up directly"""
+    def __init__(self):
+        self.item_names: set[str] = set()
+        self.item_categories: set[str] = set()
+        self.item_name_counts: Counter[str] = Counter()
+
+        for item in DataValidation.item_table:
+            self.item_names.add(item["name"])
+            self.item_name_counts[item["name"]] += 1
+            self.item_categories.update(item.get("category", []))
+
+        self.location_name_counts: Counter[str] = Counter(location["name"] for location in DataValidation.location_table)
+        self.region_names: set[str] = set(DataValidation.region_table)
+        # every region that at least one region connects to
+        self.connected_region_names: set[str] = set()
+
+        for region in DataValidation.region_table.values():
+            self.connected_region_names.update(region.get("connects_to") or [])
+
 class DataValidation():
     game_table = {}
     item_table = []
     location_table = []
     region_table = {}
-
+    index: Optional[DataValidationIndex] = None
 
     @staticmethod
-    def checkItemNamesInLocationRequires():
-        for location in DataValidation.location_table:
-            if "requires" not in location:
-                continue
+    def getIndex() -> DataValidationIndex:
+        if DataValidation.index is None:
+            DataValidation.index = DataValidationIndex()
+        return DataValidation.index
 
-            if isinstance(location["requires"], str):
-                # parse user written statement into list of each item
-                for item in re.findall(r'\|[^|]+\|', location["requires"]):
-                    if item.lower() == "or" or item.lower() == "and" or item == ")" or item == "(":
-                        continue
-                    else:
-                        # it's just a category, so ignore it
-                        if '@' in item:
-                            continue
-
-                        item = item.replace("|", "")
-
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
-
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
-
-            else:  # item access is in dict form
-                for item in location["requires"]:
-                    # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-                    if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                        or_items = item
-
-                        if isinstance(item, dict):
-                            or_items = item["or"]
+    @staticmethod
+    def raiseErrors(errors: list[str]):
+        """Raise every problem a check found as a single ValidationError, one problem per line"""
+        if errors:
+            raise ValidationError("\n - ".join(errors))
 
-                        for or_item in or_items:
-                            or_item_parts = or_item.split(":")
-                            or_item_name = or_item
+    @staticmethod
+    def iterRequiredItemNames(requires) -> Iterator[str]:
+        """Yield the name of every item (but not category) a requires refers to, be it a string or in the legacy dict form"""
+        if isinstance(requires, str):
+            # read the items from the tokens of the user written statement, including the ones passed to functions
+            for requirement in iter_requires_items(requires):
+                # it's just a category, so ignore it
+                if not requirement.category:
+                    yield requirement.name
+            return
 
-                            if len(or_item_parts) > 1:
-                                or_item_name = or_item_parts[0]
+        for item in requires:
+            # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
+            if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
+                or_items = item["or"] if isinstance(item, dict) else item
+            else:
+                or_items = [item]
 
-                            item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == or_item_name]) > 0
+            for or_item in or_items:
+                yield or_item.split(":")[0]
 
-                            if not item_exists:
-                                raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (or_item_name, location["name"]))
-                    else:
-                        item_parts = item.split(":")
-                        item_name = item
+    @staticmethod
+    def checkItemNamesInLocationRequires():
+        item_names = DataValidation.getIndex().item_names
+        errors = []
 
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
+        for location in DataValidation.location_table:
+            if "requires" not in location:
+                continue
 
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
+            for item_name in dict.fromkeys(DataValidation.iterRequiredItemNames(location["requires"])):
+                if item_name not in item_names:
+                    errors.append("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
 
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by location %s but is misspelled or does not exist." % (item_name, location["name"]))
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkItemNamesInRegionRequires():
-        for region_name in DataValidation.region_table:
-            region = DataValidation.region_table[region_name]
+        item_names = DataValidation.getIndex().item_names
+        errors = []
 
+        for region_name, region in DataValidation.region_table.items():
             if "requires" not in region:
                 continue
 
-            if isinstance(region["requires"], str):
-                # parse user written statement into list of each item
-                for item in re.findall(r'\|[^|]+\|', region["requires"]):
-                    if item.lower() == "or" or item.lower() == "and" or item == ")" or item == "(":
-                        continue
-                    else:
-                        # it's just a category, so ignore it
-                        if '@' in item:
-                            continue
-
-                        item = item.replace("|", "")
-
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
-
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
-
-            else:  # item access is in dict form
-                for item in region["requires"]:
-                    # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-                    if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                        or_items = item
-
-                        if isinstance(item, dict):
-                            or_items = item["or"]
-
-                        for or_item in or_items:
-                            or_item_parts = or_item.split(":")
-                            or_item_name = or_item
-
-                            if len(or_item_parts) > 1:
-                                or_item_name = or_item_parts[0]
-
-                            item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == or_item_name]) > 0
-
-                            if not item_exists:
-                                raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (or_item_name, region_name))
-                    else:
-                        item_parts = item.split(":")
-                        item_name = item
-
-                        if len(item_parts) > 1:
-                            item_name = item_parts[0]
+            for item_name in dict.fromkeys(DataValidation.iterRequiredItemNames(region["requires"])):
+                if item_name not in item_names:
+                    errors.append("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
 
-                        item_exists = len([item["name"] for item in DataValidation.item_table if item["name"] == item_name]) > 0
-
-                        if not item_exists:
-                            raise ValidationError("Item %s is required by region %s but is misspelled or does not exist." % (item_name, region_name))
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkRegionNamesInLocations():
+        region_names = DataValidation.getIndex().region_names
+        errors = []
+
         for location in DataValidation.location_table:
             if "region" not in location or location["region"] in ["Menu", "Manual"]:
                 continue
 
-            region_exists = len([name for name in DataValidation.region_table if name == location["region"]]) > 0
+            if location["region"] not in region_names:
+                errors.append("Region %s is set for location %s, but the region is misspelled or does not exist." % (location["region"], location["name"]))
 
-            if not region_exists:
-                raise ValidationError("Region %s is set for location %s, but the region is misspelled or does not exist." % (location["region"], location["name"]))
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkItemsThatShouldBeRequired():
-        for item in DataValidation.item_table:
-            # if the item is already progression, no need to check
-            if "progression" in item and item["progression"]:
-                continue
-
-            # progression_skip_balancing is also progression, so no check needed
-            if "progression_skip_balancing" in item and item["progression_skip_balancing"]:
-                continue
-
-            # check location requires for the presence of item name
-            for location in DataValidation.location_table:
-                if "requires" not in location:
-                    continue
+        # progression_skip_balancing is also progression, so no check needed for either
+        non_progression_names = {item["name"] for item in DataValidation.item_table
+                                 if not item.get("progression") and not item.get("progression_skip_balancing")}
 
-                # convert to json so we don't have to guess the data type
-                location_requires = json.dumps(location["requires"])
+        # item name -> the locations and regions whose requires refer to it, reading each requires only once
+        referenced_by: dict[str, list[str]] = {}
 
-                # if boolean, else legacy
-                if isinstance(location_requires, str):
-                    if '|{}|'.format(item["name"]) in location_requires:
-                        raise ValidationError("Item %s is required by location %s, but the item is not marked as progression." % (item["name"], location["name"]))
-                else:
-                    if item["name"] in location_requires:
-                        raise ValidationError("Item %s is required by location %s, but the item is not marked as progression." % (item["name"], location["name"]))
+        for location in DataValidation.location_table:
+            if "requires" not in location:
+                continue
 
-            # check region requires for the presence of item name
-            for region_name in DataValidation.region_table:
-                region = DataValidation.region_table[region_name]
+            for item_name in dict.fromkeys(DataValidation.iterRequiredItemNames(location["requires"])):
+                referenced_by.setdefault(item_name, []).append("location %s" % location["name"])
 
-                if "requires" not in region:
-                    continue
+        for region_name, region in DataValidation.region_table.items():
+            if "requires" not in region:
+                continue
 
-                # convert to json so we don't have to guess the data type
-                region_requires = json.dumps(region["requires"])
+            for item_name in dict.fromkeys(DataValidation.iterRequiredItemNames(region["requires"])):
+                referenced_by.setdefault(item_name, []).append("region %s" % region_name)
 
-                # if boolean, else legacy
-                if isinstance(region_requires, str):
-                    if '|{}|'.format(item["name"]) in region_requires:
-                        raise ValidationError("Item %s is required by region %s, but the item is not marked as progression." % (item["name"], region_name))
-                else:
-                    if item["name"] in region_requires:
-                        raise ValidationError("Item %s is required by region %s, but the item is not marked as progression." % (item["name"], region_name))
+        DataValidation.raiseErrors(["Item %s is required by %s, but the item is not marked as progression." % (item_name, ", ".join(referenced_by[item_name]))
+                                    for item_name in sorted(non_progression_names & referenced_by.keys())])
 
     @staticmethod
-    def _checkLocationRequiresForItemValueWithRegex(values_requested: dict[str, int], requires) -> dict[str, int]:
+    def _checkLocationRequiresForItemValue(values_requested: dict[str, int], requires) -> dict[str, int]:
         if isinstance(requires, str) and 'ItemValue' in requires:
-            for result in re.findall(r'\{ItemValue\(([^:]*)\:([^)]+)\)\}', requires):
-                value = result[0].lower().strip()
-                count = int(result[1])
+            for token in tokenize_requires(requires):
+                if token.kind != token_function or token.node.name != "ItemValue" or ":" not in token.node.raw_args:
+                    continue
+
+                value, count = token.node.raw_args.split(":", 1)
+                value = value.lower().strip()
+                count = int(count)
                 if not values_requested.get(value):
                     values_requested[value] = count
                 else:
@@ -217,10 +165,7 @@ class DataValidation():
             if "requires" not in location:
                 continue
 
-            # convert to json so we don't have to guess the data type
-            location_requires = json.dumps(location["requires"])
-
-            DataValidation._checkLocationRequiresForItemValueWithRegex(values_requested, location_requires)
+            DataValidation._checkLocationRequiresForItemValue(values_requested, location["requires"])
         # Second, check region requires for the presence of item name
         for region_name in DataValidation.region_table:
             region = DataValidation.region_table[region_name]
@@ -228,10 +173,7 @@ class DataValidation():
             if "requires" not in region:
                 continue
 
-            # convert to json so we don't have to guess the data type
-            region_requires = json.dumps(region["requires"])
-
-            DataValidation._checkLocationRequiresForItemValueWithRegex(values_requested, region_requires)
+            DataValidation._checkLocationRequiresForItemValue(values_requested, region["requires"])
         # then if something is requested, we loop items
         if values_requested:
 
@@ -270,14 +212,12 @@ class DataValidation():
 
             manualregion = DataValidation.region_table.get(region.name, {})
             if "requires" in manualregion and manualregion["requires"]:
-                region_requires = json.dumps(manualregion["requires"])
-
-                DataValidation._checkLocationRequiresForItemValueWithRegex(values_requested, region_requires)
+                DataValidation._checkLocationRequiresForItemValue(values_requested, manualregion["requires"])
 
             for location in region.locations:
                 manualLocation = world.location_name_to_location.get(location.name, {})
                 if "requires" in manualLocation and manualLocation["requires"]:
-                    DataValidation._checkLocationRequiresForItemValueWithRegex(values_requested, manualLocation["requires"])
+                    DataValidation._checkLocationRequiresForItemValue(values_requested, manualLocation["requires"])
 
         # compare whats available vs requested but only if there's anything requested
         if values_requested:
@@ -300,63 +240,59 @@ class DataValidation():
 
     @staticmethod
     def checkRegionsConnectingToOtherRegions():
-        for region_name in DataValidation.region_table:
-            region = DataValidation.region_table[region_name]
+        region_names = DataValidation.getIndex().region_names
+        errors = []
 
+        for region_name, region in DataValidation.region_table.items():
             if "connects_to" not in region:
                 continue
 
             for connecting_region in region["connects_to"]:
-                region_exists = len([name for name in DataValidation.region_table if name == connecting_region]) > 0
+                if connecting_region not in region_names:
+                    errors.append("Region %s connects to a region %s, which is misspelled or does not exist." % (region_name, connecting_region))
 
-                if not region_exists:
-                    raise ValidationError("Region %s connects to a region %s, which is misspelled or does not exist." % (region_name, connecting_region))
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkForDuplicateItemNames():
-        for item in DataValidation.item_table:
-            name_count = len([i for i in DataValidation.item_table if i["name"] == item["name"]])
-
-            if name_count > 1:
-                raise ValidationError("Item %s is defined more than once." % (item["name"]))
+        name_counts = DataValidation.getIndex().item_name_counts
+        DataValidation.raiseErrors(["Item %s is defined more than once." % (name) for name, count in name_counts.items() if count > 1])
 
     @staticmethod
     def checkForDuplicateLocationNames():
-        for location in DataValidation.location_table:
-            name_count = len([l for l in DataValidation.location_table if l["name"] == location["name"]])
-
-            if name_count > 1:
-                raise ValidationError("Location %s is defined more than once." % (location["name"]))
+        name_counts = DataValidation.getIndex().location_name_counts
+        DataValidation.raiseErrors(["Location %s is defined more than once." % (name) for name, count in name_counts.items() if count > 1])
 
     @staticmethod
     def checkForDuplicateRegionNames():
         # this currently does nothing because the region name is a dict key, which will never be non-unique / limited to 1
-        for region_name in DataValidation.region_table:
-            name_count = len([r for r in DataValidation.region_table if r == region_name])
-
-            if name_count > 1:
-                raise ValidationError("Region %s is defined more than once." % (region_name))
+        name_counts = Counter(DataValidation.region_table.keys())
+        DataValidation.raiseErrors(["Region %s is defined more than once." % (name) for name, count in name_counts.items() if count > 1])
 
     @staticmethod
     def checkStartingItemsForValidItemsAndCategories():
         if "starting_items" not in DataValidation.game_table:
             return
 
+        index = DataValidation.getIndex()
         starting_items = DataValidation.game_table["starting_items"]
+        errors = []
 
         for starting_block in starting_items:
             if "items" in starting_block and "item_categories" in starting_block:
-                raise ValidationError("One of your starting item definitions has both 'items' and 'item_categories' defined, but only one will be applied.")
+                errors.append("One of your starting item definitions has both 'items' and 'item_categories' defined, but only one will be applied.")
 
             if "items" in starting_block:
                 for item_name in starting_block["items"]:
-                    if not item_name in [item["name"] for item in DataValidation.item_table]:
-                        raise ValidationError("Item %s is set as a starting item, but is misspelled or is not defined." % (item_name))
+                    if item_name not in index.item_names:
+                        errors.append("Item %s is set as a starting item, but is misspelled or is not defined." % (item_name))
 
             if "item_categories" in starting_block:
                 for category_name in starting_block["item_categories"]:
-                    if len([item for item in DataValidation.item_table if "category" in item and category_name in item["category"]]) == 0:
-                        raise ValidationError("Item category %s is set as a starting item category, but is misspelled or is not defined on any items." % (category_name))
+                    if category_name not in index.item_categories:
+                        errors.append("Item category %s is set as a starting item category, but is misspelled or is not defined on any items." % (category_name))
+
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkStartingItemsForBadSyntax():
@@ -390,6 +326,9 @@ class DataValidation():
 
     @staticmethod
     def checkPlacedItemsForValidItems():
+        item_names = DataValidation.getIndex().item_names
+        errors = []
+
         for location in DataValidation.location_table:
             if not (place_item := location.get("place_item", False)):
                 continue
@@ -399,11 +338,16 @@ class DataValidation():
                 continue
 
             for item_name in place_item:
-                if not item_name in [item["name"] for item in DataValidation.item_table]:
-                    raise ValidationError("Item %s is placed (using place_item) on a location, but is misspelled or is not defined." % (item_name))
+                if item_name not in item_names:
+                    errors.append("Item %s is placed (using place_item) on a location, but is misspelled or is not defined." % (item_name))
+
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkPlacedItemCategoriesForValidItemCategories():
+        item_categories = DataValidation.getIndex().item_categories
+        errors = []
+
         for location in DataValidation.location_table:
             if not (place_item_category := location.get("place_item_category", False)):
                 continue
@@ -413,8 +357,10 @@ class DataValidation():
                 continue
 
             for category_name in place_item_category:
-                if len([item for item in DataValidation.item_table if "category" in item and category_name in item["category"]]) == 0:
-                    raise ValidationError("Item category %s is placed (using place_item_category) on a location, but is misspelled or is not defined." % (category_name))
+                if category_name not in item_categories:
+                    errors.append("Item category %s is placed (using place_item_category) on a location, but is misspelled or is not defined." % (category_name))
+
+        DataValidation.raiseErrors(errors)
 
     @staticmethod
     def checkForGameBeingInvalidJSON():
@@ -433,18 +379,14 @@ class DataValidation():
 
     @staticmethod
     def checkForNonStartingRegionsThatAreUnreachable():
-        using_starting_regions = len([region for region in DataValidation.region_table if "starting" in DataValidation.region_table[region] and not DataValidation.region_table[region]["starting"]]) > 0
-
-        if not using_starting_regions:
-            return
-
         nonstarting_regions = [region for region in DataValidation.region_table if "starting" in DataValidation.region_table[region] and not DataValidation.region_table[region]["starting"]]
 
-        for nonstarter in nonstarting_regions:
-            regions_that_connect_to = [region for region in DataValidation.region_table if "connects_to" in DataValidation.region_table[region] and nonstarter in DataValidation.region_table[region]["connects_to"]]
+        if not nonstarting_regions:
+            return
 
-            if len(regions_that_connect_to) == 0:
-                raise ValidationError("The region '%s' is set as a non-starting region, but has no regions that connect to it. It will be inaccessible." % nonstarter)
+        connected_region_names = DataValidation.getIndex().connected_region_names
+        DataValidation.raiseErrors(["The region '%s' is set as a non-starting region, but has no regions that connect to it. It will be inaccessible." % nonstarter
+                                    for nonstarter in nonstarting_regions if nonstarter not in connected_region_names])
 
 
 def runPreFillDataValidation(world: World, multiworld: MultiWorld):
@@ -461,6 +403,9 @@ def runPreFillDataValidation(world: World, multiworld: MultiWorld):
 def runGenerationDataValidation() -> None:
     validation_errors = []
 
+    # index the tables as they are now, after the hooks had their turn at them
+    DataValidation.index = DataValidationIndex()
+
     # check that requires have correct item names in locations and regions
     try: DataValidation.checkItemNamesInLocationRequires()
     except ValidationError as e: validation_errors.append(e)
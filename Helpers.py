@@ -1,10 +1,12 @@
 from BaseClasses import MultiWorld, Item
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Mapping, Optional, List
+from weakref import WeakKeyDictionary
 from worlds.AutoWorld import World
 from .Data import category_table
-from .Items import ManualItem
+from .Items import ManualItem, value_name_to_item_values
 from .Locations import ManualLocation
-from .hooks.Helpers import before_is_category_enabled, before_is_item_enabled, before_is_location_enabled
+from .hooks.Helpers import before_are_categories_enabled, before_is_category_enabled, before_is_item_enabled, before_is_location_enabled
 
 from typing import Union
 
@@ -18,6 +20,13 @@ def get_option_value(multiworld: MultiWorld, player: int, name: str) -> Union[in
 
     return option.value
 
+def option_only_rule(func):
+    """Mark a requires function whose result only depends on the player's options.\n
+    These are resolved once when rules are set (with state=None) instead of on every access check.
+    """
+    func.option_only = True
+    return func
+
 def clamp(value, min, max):
     """Returns value clamped to the inclusive range of min and max"""
     if value < min:
@@ -29,10 +38,52 @@ def clamp(value, min, max):
 
 def is_category_enabled(multiworld: MultiWorld, player: int, category_name: str) -> bool:
     """Check if a category has been disabled by a yaml option."""
-    hook_result = before_is_category_enabled(multiworld, player, category_name)
-    if hook_result is not None:
-        return hook_result
+    category_enabled = get_category_enabled_table(multiworld, player)
+    if category_name in category_enabled:
+        return category_enabled[category_name]
+
+    # a category no item or location uses, so it isn't in the table, and is decided once on first use instead
+    unused_category_enabled = multiworld.worlds[player].unused_category_enabled
+    if category_name not in unused_category_enabled:
+        unused_category_enabled[category_name] = _build_category_enabled_table(multiworld, player, [category_name])[category_name]
+
+    return unused_category_enabled[category_name]
+
+def get_category_enabled_table(multiworld: MultiWorld, player: int) -> Mapping[str, bool]:
+    """Return whether each category used by the items, locations and categories.json is enabled for a player.\n
+    Built once per player from their options, reset by setting world.category_enabled back to None.
+    Categories missing from it are kept in world.unused_category_enabled, which is reset along with it.
+    """
+    world = multiworld.worlds[player]
+
+    if getattr(world, 'category_enabled', None) is None:
+        category_names = dict.fromkeys(category_table)
+        for data in (*world.item_name_to_item.values(), *world.location_name_to_location.values()):
+            category_names.update(dict.fromkeys(data.get("category", [])))
+
+        world.category_enabled = MappingProxyType(_build_category_enabled_table(multiworld, player, list(category_names)))
+        world.unused_category_enabled = {}
+
+    return world.category_enabled
 
+def _build_category_enabled_table(multiworld: MultiWorld, player: int, category_names: list[str]) -> dict[str, bool]:
+    """Internal method: decide every category at once with the batch hook, then the per category hook and yaml options for the rest"""
+    category_enabled = dict(before_are_categories_enabled(multiworld, player, category_names) or {})
+
+    for category_name in category_names:
+        if category_name in category_enabled:
+            continue
+
+        hook_result = before_is_category_enabled(multiworld, player, category_name)
+        if hook_result is not None:
+            category_enabled[category_name] = hook_result
+        else:
+            category_enabled[category_name] = _is_category_enabled_by_options(multiworld, player, category_name)
+
+    return category_enabled
+
+def _is_category_enabled_by_options(multiworld: MultiWorld, player: int, category_name: str) -> bool:
+    """Internal method: the default behavior of is_category_enabled, checking the yaml_option of the category"""
     category_data = category_table.get(category_name, {})
     if "yaml_option" in category_data:
         for option_name in category_data["yaml_option"]:
@@ -93,6 +144,27 @@ def get_items_for_player(multiworld: MultiWorld, player: int) -> List[Item]:
     """Return list of items of a player including placed items"""
     return [i for i in multiworld.get_items() if i.player == player]
 
+# multiworld -> player -> item name -> copies in the multiworld, counted in one pass and shared by every slot
+_pool_item_counts: "WeakKeyDictionary[MultiWorld, dict[int, dict[str, int]]]" = WeakKeyDictionary()
+
+def get_pool_item_counts(multiworld: MultiWorld, player: int) -> dict[str, int]:
+    """Return how many copies of each item a player has in the multiworld, placed or not\n
+    The whole multiworld is counted at once and kept until clear_pool_item_counts is called
+    """
+    counts = _pool_item_counts.get(multiworld)
+    if counts is None:
+        counts = {}
+        for item in multiworld.get_items():
+            player_counts = counts.setdefault(item.player, {})
+            player_counts[item.name] = player_counts.get(item.name, 0) + 1
+        _pool_item_counts[multiworld] = counts
+
+    return counts.get(player, {})
+
+def clear_pool_item_counts(multiworld: MultiWorld):
+    """Forget the counts of get_pool_item_counts, to be called whenever items are added to or removed from the multiworld"""
+    _pool_item_counts.pop(multiworld, None)
+
 def get_items_with_value(world: World, multiworld: MultiWorld, value: str, player: Optional[int] = None, force: bool = False) -> dict[str, int]:
     """Return a dict of every items with a specific value type present in their respective 'value' dict\n
     Output in the format 'Item Name': 'value count'\n
@@ -101,7 +173,10 @@ def get_items_with_value(world: World, multiworld: MultiWorld, value: str, playe
     if player is None:
         player = world.player
 
-    player_items = get_items_for_player(multiworld, player)
+    if force:
+        clear_pool_item_counts(multiworld)
+
+    player_items = get_pool_item_counts(multiworld, player)
     # Just a small check to prevent caching {} if items don't exist yet
     if not player_items:
         return {value: -1}
@@ -115,8 +190,6 @@ def get_items_with_value(world: World, multiworld: MultiWorld, value: str, playe
         world.item_values[player] = {}
 
     if value not in world.item_values.get(player, {}).keys() or force:
-        item_with_values = {i.name: world.item_name_to_item[i.name]['value'].get(value, 0)
-                            for i in player_items if i.code is not None
-                            and i.name in world.item_name_groups.get(f'has_{value}_value', [])}
+        item_with_values = {name: amount for name, amount in value_name_to_item_values.get(value, {}).items() if name in player_items}
         world.item_values[player][value] = item_with_values
     return world.item_values[player].get(value)
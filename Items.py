@@ -11,7 +11,7 @@ item_table = before_item_table_processed(item_table)
 
 item_id_to_name: dict[int, str] = {}
 item_name_to_item: dict[str, dict] = {}
-item_name_groups: dict[str, str] = {}
+group_members: dict[str, set[str]] = {}
 advancement_item_names: set[str] = set()
 lastItemId = -1
 
@@ -38,20 +38,59 @@ for item in item_table:
         lastItemId = max(lastItemId, item["id"])
 
     for c in item.get("category", []):
-        if c not in item_name_groups:
-            item_name_groups[c] = []
-        item_name_groups[c].append(item_name)
+        group_members.setdefault(c, set()).add(item_name)
 
     for v in item.get("value", {}).keys():
-        group_name = f"has_{v.lower().strip()}_value"
-        if group_name not in item_name_groups:
-            item_name_groups[group_name] = []
-        item_name_groups[group_name].append(item_name)
+        group_members.setdefault(f"has_{v.lower().strip()}_value", set()).add(item_name)
+
+# membership tests go through the frozensets, while AP gets a stable sorted list of each group
+item_name_group_sets: dict[str, frozenset[str]] = {group: frozenset(names) for group, names in group_members.items()}
+item_name_groups: dict[str, list[str]] = {group: sorted(names) for group, names in group_members.items()}
+
+def get_items_in_categories(categories: list[str]) -> frozenset[str]:
+    """Return the names of the items that belong to any of the given categories"""
+    if len(categories) == 1:
+        return item_name_group_sets.get(categories[0], frozenset())
+    return frozenset().union(*(item_name_group_sets.get(c, ()) for c in categories))
 
 item_id_to_name[None] = "__Victory__"
 item_name_to_id = {name: id for id, name in item_id_to_name.items()}
 
 
+######################
+# Collection counters
+######################
+
+def category_counter_name(category: str) -> str:
+    """Name of the CollectionState entry that holds how many items of a category have been collected"""
+    return f"__category_{category}__"
+
+def value_counter_name(value: str) -> str:
+    """Name of the CollectionState entry that holds how much of a value has been collected"""
+    return f"__value_{value.lower().strip()}__"
+
+# CollectionState entry bumped every time a player's collected items change, so rule results can be reused until then
+state_version_name = "__state_version__"
+
+# what collecting one copy of an item adds to the category and value counters
+item_name_to_counters: dict[str, tuple[tuple[str, int], ...]] = {}
+# value name (lowercase) -> item name -> how much of that value one copy of the item is worth
+value_name_to_item_values: dict[str, dict[str, int]] = {}
+
+for item in item_table:
+    counters = {category_counter_name(c): 1 for c in item.get("category", [])}
+
+    for v, amount in item.get("value", {}).items():
+        item_values = value_name_to_item_values.setdefault(v.lower().strip(), {})
+        item_values[item["name"]] = item_values.get(item["name"], 0) + int(amount)
+
+        if int(amount) != 0:
+            counters[value_counter_name(v)] = counters.get(value_counter_name(v), 0) + int(amount)
+
+    if counters:
+        item_name_to_counters[item["name"]] = tuple(counters.items())
+
+
 ######################
 # Item classes
 ######################
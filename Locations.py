@@ -37,16 +37,18 @@ if not victory_names:
 
 location_id_to_name: dict[int, str] = {}
 location_name_to_location: dict[str, dict] = {}
-location_name_groups: dict[str, list[str]] = {}
+region_name_to_locations: dict[str, list[dict]] = {}
+group_members: dict[str, set[str]] = {}
 
 for item in location_table:
     location_id_to_name[item["id"]] = item["name"]
     location_name_to_location[item["name"]] = item
+    region_name_to_locations.setdefault(item["region"], []).append(item)
 
     for c in item.get("category", []):
-        if c not in location_name_groups:
-            location_name_groups[c] = []
-        location_name_groups[c].append(item["name"])
+        group_members.setdefault(c, set()).add(item["name"])
+
+location_name_groups: dict[str, list[str]] = {group: sorted(names) for group, names in group_members.items()}
 
 
 # location_id_to_name[None] = "__Manual Game Complete__"
@@ -72,3 +72,4 @@ world_description: str = set_world_description("""
 world_webworld: ManualWeb = set_world_webworld(ManualWeb())
 
 enable_region_diagram = bool(meta_table.get("enable_region_diagram", False))
+enable_legacy_rules = bool(meta_table.get("enable_legacy_rules", False))
@@ -1,7 +1,7 @@
 from BaseClasses import Entrance, MultiWorld, Region
 from .Helpers import is_category_enabled, is_location_enabled
 from .Data import region_table
-from .Locations import ManualLocation, location_name_to_location
+from .Locations import ManualLocation, location_name_to_location, region_name_to_locations, victory_names
 from worlds.AutoWorld import World
 from .hooks.Regions import before_region_table_processed
 
@@ -22,6 +22,10 @@ regionMap["Manual"] = {
 regionMap = before_region_table_processed(regionMap)
 
 def create_regions(world: World, multiworld: MultiWorld, player: int):
+    # of the victory locations, only the one of the chosen goal is created
+    goal_location_name = getattr(world, "victory_location_name", None)
+    unused_victory_names = set(victory_names) - {goal_location_name} if goal_location_name else set()
+
     # Create regions and assign locations to each region
     for region in regionMap:
         if "connects_to" not in regionMap[region]:
@@ -34,10 +38,12 @@ def create_regions(world: World, multiworld: MultiWorld, player: int):
             exit_array = None
 
         locations = []
-        for location in world.location_table:
-            if "region" in location and location["region"] == region:
-                if is_location_enabled(multiworld, player, location):
-                    locations.append(location["name"])
+        for location in region_name_to_locations.get(region, []):
+            if location["name"] in unused_victory_names:
+                continue
+
+            if is_location_enabled(multiworld, player, location):
+                locations.append(location["name"])
 
         new_region = create_region(world, multiworld, player, region, locations, exit_array)
         multiworld.regions += [new_region]
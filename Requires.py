@@ -0,0 +1,260 @@
+from dataclasses import dataclass
+from typing import Iterator, Optional, Union
+
+import re
+
+######################
+# Requires string parsing
+######################
+#
+# A requires string like "(|Item A| AND |@Category:2|) OR {Function(arg)}" is split once into a stream of tokens,
+# which the legacy interpreter and DataValidation read directly, and which is parsed into a small tree
+# of the nodes below that Rules.py then compiles into access rules.
+#
+# AND and OR share the same precedence and are evaluated left to right, while ! negates the term that follows it.
+
+@dataclass(frozen=True)
+class RequiresItem:
+    name: str
+    count: str = "1"
+    category: bool = False
+
+@dataclass(frozen=True)
+class RequiresFunction:
+    name: str
+    args: tuple[str, ...] = ()
+    raw_args: str = ""
+
+@dataclass(frozen=True)
+class RequiresAnd:
+    children: tuple
+
+@dataclass(frozen=True)
+class RequiresOr:
+    children: tuple
+
+@dataclass(frozen=True)
+class RequiresNot:
+    child: "RequiresNode"
+
+@dataclass(frozen=True)
+class RequiresConstant:
+    value: bool
+
+RequiresNode = Union[RequiresItem, RequiresFunction, RequiresAnd, RequiresOr, RequiresNot, RequiresConstant]
+
+@dataclass(frozen=True)
+class RequiresToken:
+    kind: str # one of the token_* kinds below
+    text: str # the text the token was read from
+    node: Optional[RequiresNode] = None # the requirement of item, category, function and constant tokens
+
+token_item = "item"
+token_category = "category"
+token_function = "function"
+token_constant = "constant"
+token_and = "and"
+token_or = "or"
+token_not = "not"
+token_open = "("
+token_close = ")"
+
+# the kinds of token that are a requirement on their own, as opposed to operators and parentheses
+term_token_kinds = (token_item, token_category, token_function, token_constant)
+
+_token_pattern = re.compile(r'\{(\w+)\(([^)]*)\)\}|\|([^|]+)\||\b(AND|OR)\b|\b([01])\b|([()!&])', re.IGNORECASE)
+_symbol_kinds = {"(": token_open, ")": token_close, "!": token_not, "&": token_and}
+
+# every requires string is only ever tokenized once, however many areas or rules read it
+_token_cache: dict[str, tuple[RequiresToken, ...]] = {}
+
+
+def tokenize_requires(requires: str) -> tuple[RequiresToken, ...]:
+    """Split a requires string into its items, categories, functions, constants, operators and parentheses.\n
+    Anything between those (mostly whitespace) is skipped, and the result is cached per string.
+    """
+    if requires in _token_cache:
+        return _token_cache[requires]
+
+    tokens = []
+
+    for match in _token_pattern.finditer(requires):
+        func_name, func_args, item, word, constant, symbol = match.groups()
+        text = match.group(0)
+
+        if func_name is not None:
+            args = func_args.split(",")
+            if args == ['']:
+                args.pop()
+
+            tokens.append(RequiresToken(token_function, text, RequiresFunction(func_name, tuple(args), func_args)))
+        elif item is not None:
+            category = item.startswith("@")
+            item = item.lstrip('@$')
+
+            item_parts = item.split(":")  # type: list[str]
+            item_name = item
+            item_count = "1"
+
+            if len(item_parts) > 1:
+                item_name = item_parts[0].strip()
+                item_count = item_parts[1].strip()
+
+            tokens.append(RequiresToken(token_category if category else token_item, text, RequiresItem(item_name, item_count, category)))
+        elif word is not None:
+            tokens.append(RequiresToken(token_and if word.upper() == "AND" else token_or, text))
+        elif constant is not None:
+            tokens.append(RequiresToken(token_constant, text, RequiresConstant(constant == "1")))
+        else:
+            tokens.append(RequiresToken(_symbol_kinds[symbol], text))
+
+    _token_cache[requires] = tuple(tokens)
+    return _token_cache[requires]
+
+
+def iter_requires_items(requires: str) -> Iterator[RequiresItem]:
+    """Yield every item and category a requires string mentions, including the ones passed to its functions"""
+    for token in tokenize_requires(requires):
+        if token.kind in (token_item, token_category):
+            yield token.node
+        elif token.kind == token_function and "|" in token.node.raw_args:
+            yield from iter_requires_items(token.node.raw_args)
+
+
+def _combine(operator: str, left: RequiresNode, right: RequiresNode) -> RequiresNode:
+    node_type = RequiresAnd if operator == token_and else RequiresOr
+    children = left.children if isinstance(left, node_type) else (left,)
+
+    return node_type(children + (right,))
+
+
+def parse_requires(requires: str) -> RequiresNode:
+    """Parse a requires string into a tree of Requires* nodes.\n
+    Raises a ValueError if the string is not a valid boolean expression.
+    """
+    tokens = tokenize_requires(requires)
+    position = 0
+
+    def parse_expression() -> RequiresNode:
+        nonlocal position
+        node = parse_unary()
+
+        while position < len(tokens) and tokens[position].kind in (token_and, token_or):
+            operator = tokens[position].kind
+            position += 1
+            node = _combine(operator, node, parse_unary())
+
+        return node
+
+    def parse_unary() -> RequiresNode:
+        nonlocal position
+
+        if position >= len(tokens):
+            raise ValueError(f"Unexpected end of requires `{requires}`.")
+
+        token = tokens[position]
+        position += 1
+
+        if token.kind == token_not:
+            return RequiresNot(parse_unary())
+        if token.kind in term_token_kinds:
+            return token.node
+        if token.kind == token_open:
+            node = parse_expression()
+            if position >= len(tokens) or tokens[position].kind != token_close:
+                raise ValueError(f"Unbalanced parentheses in requires `{requires}`.")
+            position += 1
+            return node
+
+        raise ValueError(f"Unexpected `{token.text}` in requires `{requires}`.")
+
+    if not tokens:
+        raise ValueError(f"No requirements found in requires `{requires}`.")
+
+    tree = parse_expression()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected `{tokens[position].text}` in requires `{requires}`.")
+
+    return tree
+
+
+def simplify_requires(node: RequiresNode) -> RequiresNode:
+    """Remove the constants from a tree, pruning the branches they decide.\n
+    The result is either a RequiresConstant or a tree without any RequiresConstant in it.
+    """
+    if isinstance(node, RequiresNot):
+        child = simplify_requires(node.child)
+        if isinstance(child, RequiresConstant):
+            return RequiresConstant(not child.value)
+        return RequiresNot(child)
+
+    if isinstance(node, (RequiresAnd, RequiresOr)):
+        # the value that decides the whole AND (False) or OR (True) on its own
+        deciding = isinstance(node, RequiresOr)
+        children = []
+
+        for child in node.children:
+            child = simplify_requires(child)
+            if isinstance(child, RequiresConstant):
+                if child.value == deciding:
+                    return child
+                continue
+            children.append(child)
+
+        if not children:
+            return RequiresConstant(not deciding)
+        if len(children) == 1:
+            return children[0]
+        return type(node)(tuple(children))
+
+    return node
+
+
+# rough relative cost of checking each kind of requirement, so the cheap ones can be checked first
+_item_cost = 1
+_category_cost = 2
+_function_cost = 10
+
+
+def requires_cost(node: RequiresNode) -> int:
+    """Estimate how expensive a tree is to evaluate: items are cheapest, then categories, then functions"""
+    if isinstance(node, (RequiresAnd, RequiresOr)):
+        return sum(requires_cost(child) for child in node.children)
+    if isinstance(node, RequiresNot):
+        return requires_cost(node.child)
+    if isinstance(node, RequiresFunction):
+        return _function_cost
+    if isinstance(node, RequiresItem):
+        return _category_cost if node.category else _item_cost
+    return 0
+
+
+def order_requires(node: RequiresNode) -> RequiresNode:
+    """Sort the operands of every AND/OR from cheapest to most expensive, so evaluation stops on cheap checks"""
+    if isinstance(node, (RequiresAnd, RequiresOr)):
+        children = [order_requires(child) for child in node.children]
+        return type(node)(tuple(sorted(children, key=requires_cost)))
+    if isinstance(node, RequiresNot):
+        return RequiresNot(order_requires(node.child))
+    return node
+
+
+def requires_references(node: RequiresNode) -> tuple[set[str], set[str], bool]:
+    """Return the item names and category names a tree refers to, and whether it calls any function"""
+    items, categories = set(), set()
+    uses_functions = False
+    nodes = [node]
+
+    while nodes:
+        node = nodes.pop()
+
+        if isinstance(node, (RequiresAnd, RequiresOr)):
+            nodes.extend(node.children)
+        elif isinstance(node, RequiresNot):
+            nodes.append(node.child)
+        elif isinstance(node, RequiresFunction):
+            uses_functions = True
+        elif isinstance(node, RequiresItem):
+            (categories if node.category else items).add(node.name)
+
+    return items, categories, uses_functions
@@ -1,12 +1,15 @@
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, Union
 from worlds.generic.Rules import set_rule
 from .Regions import regionMap
 from .hooks import Rules
-from BaseClasses import MultiWorld, CollectionState
-from .Helpers import clamp, is_item_enabled, get_items_with_value, is_option_enabled
+from BaseClasses import MultiWorld, CollectionState, Entrance, Item, Location
+from .Helpers import clamp, is_item_enabled, get_items_with_value, is_option_enabled, option_only_rule
+from .Meta import enable_legacy_rules
+from .Items import category_counter_name, item_name_to_counters, item_name_group_sets, state_version_name
+from .Requires import RequiresItem, RequiresFunction, RequiresAnd, RequiresOr, RequiresNot, RequiresConstant, RequiresNode, parse_requires, simplify_requires, order_requires, requires_references, requires_cost, \
+    RequiresToken, tokenize_requires, token_item, token_category, token_function, token_constant, token_and, token_or, token_not
 from worlds.AutoWorld import World
 
-import re
 import math
 
 if TYPE_CHECKING:
@@ -65,109 +68,387 @@ def evaluate_postfix(expr: str, location: str) -> bool:
         raise KeyError("Invalid logic format for location/region {}.".format(location))
     return stack.pop()
 
-def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
-    # this is only called when the area (think, location or region) has a "requires" field that is a string
-    def checkRequireStringForArea(state: CollectionState, area: dict):
-        requires_list = area["requires"]
-        # Generate item_counts here so it can be access each time this is called
-        if player not in world.item_counts:
-            real_pool = multiworld.get_items()
-            world.item_counts[player] = {i.name: real_pool.count(i) for i in real_pool if i.player == player}
+def _always_true(state: CollectionState) -> bool:
+    return True
+
+def _always_false(state: CollectionState) -> bool:
+    return False
+
+def resolve_item_count(item_count: str, available_count: int) -> int:
+    """Turn the count part of a requirement (a number, 'all', 'half' or a percentage) into the number of items needed"""
+    if item_count.lower() == 'all':
+        return available_count
+    elif item_count.lower() == 'half':
+        return int(available_count / 2)
+    elif item_count.endswith('%') and len(item_count) > 1:
+        percent = clamp(float(item_count[:-1]) / 100, 0, 1)
+        return math.ceil(available_count * percent)
+    else:
+        return int(item_count)
+
+def is_category_defined(world: "ManualWorld", category: str) -> bool:
+    """Does any item belong to this category?"""
+    return category in item_name_group_sets
+
+def build_requires_tree(world: "ManualWorld", multiworld: MultiWorld, player: int, requires: str, area: dict) -> RequiresNode:
+    """Parse a requires string and fold it for this player's options, cached per requires string"""
+    if not hasattr(world, 'requires_trees'): #Cache of requires string to its folded tree
+        world.requires_trees = {}
+
+    if requires in world.requires_trees:
+        return world.requires_trees[requires]
+
+    if requires == "":
+        tree = RequiresConstant(True)
+    else:
+        try:
+            tree = parse_requires(requires)
+        except ValueError as e:
+            raise KeyError("Invalid logic format for location/region {}.".format(area)) from e
+
+        tree = order_requires(simplify_requires(_fold_requires_node(world, multiworld, player, tree, area)))
+
+    world.requires_trees[requires] = tree
+    return tree
+
+def compile_requires_string(world: "ManualWorld", multiworld: MultiWorld, player: int, requires: str, area: dict) -> Callable[[CollectionState], bool]:
+    """Parse a requires string once and return an access rule for it.\n
+    Compiled rules are cached per requires string, so areas sharing the same requires share the same rule.
+    """
+    if not hasattr(world, 'compiled_requires'): #Cache of requires string to compiled rule
+        world.compiled_requires = {}
+
+    if requires in world.compiled_requires:
+        return world.compiled_requires[requires]
+
+    tree = build_requires_tree(world, multiworld, player, requires, area)
+
+    if isinstance(tree, RequiresConstant):
+        rule = _always_true if tree.value else _always_false
+    else:
+        rule = compile_requires_node(world, multiworld, player, tree, area)
+
+    world.compiled_requires[requires] = rule
+    return rule
+
+# rules cheaper than this (see requires_cost) are quicker to evaluate again than to look up
+_memoize_min_cost = 4
+
+def memoize_area_rule(world: "ManualWorld", multiworld: MultiWorld, player: int, rule: Callable[[CollectionState], bool], area: dict) -> Callable[[CollectionState], bool]:
+    """Wrap the rule of an area so its result is reused until the player's collected items change.\n
+    Only the last result is kept, so a memoized rule holds one entry no matter how many states ask it.
+    Rules calling functions are left alone, since functions can read region reachability,
+    which changes while AP is still updating a state.
+    """
+    if not isinstance(area.get("requires"), str):
+        return rule
+
+    tree = build_requires_tree(world, multiworld, player, area["requires"], area)
+    if requires_references(tree)[2] or requires_cost(tree) < _memoize_min_cost:
+        return rule
+
+    stats = world.rule_memo_stats
+    memo = [None, False] # state version the result was computed for, and the result
+
+    def memoized_rule(state: CollectionState) -> bool:
+        version = state.prog_items[player].get(state_version_name, 0)
+        if memo[0] == version:
+            stats["hits"] += 1
+            return memo[1]
+
+        stats["misses"] += 1
+        result = rule(state)
+        memo[0] = version
+        memo[1] = result
+        return result
+
+    return memoized_rule
+
+def _get_area_dependencies(world: "ManualWorld", multiworld: MultiWorld, player: int, area: dict) -> Optional[set[str]]:
+    """Return the state entries (item names and category counters) the rule of an area reads,
+    or None if it calls functions and could depend on anything."""
+    if not area or not area.get("requires"):
+        return set()
+
+    if isinstance(area["requires"], str):
+        items, categories, uses_functions = requires_references(build_requires_tree(world, multiworld, player, area["requires"], area))
+        if uses_functions:
+            return None
+        return items | {category_counter_name(category) for category in categories}
+
+    dependencies = set()
+    for item in area["requires"]:
+        or_items = [item]
+        if isinstance(item, dict) and "or" in item and isinstance(item["or"], list):
+            or_items = item["or"]
+        elif isinstance(item, list):
+            or_items = item
+
+        dependencies.update(or_item.split(":")[0] for or_item in or_items)
+    return dependencies
+
+def get_locations_to_recheck(world: "ManualWorld", items: Iterable[Union[Item, str]]) -> set[Location]:
+    """Given newly collected (or removed) items, return the locations of this world whose reachability may have changed.\n
+    This covers locations whose rule mentions the items or their categories, locations whose rule calls functions,
+    and every location behind an entrance whose rule mentions them.
+    """
+    spots = set(world.rule_dependents_unknown)
+
+    for item in items:
+        item_name = item if isinstance(item, str) else item.name
+        spots.update(world.rule_dependents.get(item_name, ()))
+
+        for counter_name, _ in item_name_to_counters.get(item_name, ()):
+            spots.update(world.rule_dependents.get(counter_name, ()))
+
+    locations = {spot for spot in spots if isinstance(spot, Location)}
+
+    # an entrance that opens up can make every region after it reachable
+    regions = [spot.connected_region for spot in spots if isinstance(spot, Entrance) and spot.connected_region]
+    visited = set()
+    while regions:
+        region = regions.pop()
+        if region in visited:
+            continue
+        visited.add(region)
 
-        # fallback if items_counts[player] not present (will not be accurate to hooks item count)
-        items_counts = world.get_item_counts()
+        locations.update(region.locations)
+        regions.extend(exit.connected_region for exit in region.exits if exit.connected_region)
 
-        if requires_list == "":
+    return locations
+
+def _get_requires_function(node: RequiresFunction, area: dict) -> Callable:
+    func = globals().get(node.name)
+
+    if func is None:
+        func = getattr(Rules, node.name, None)
+
+    if not callable(func):
+        raise ValueError(f"Invalid function `{node.name}` in {area}.")
+
+    return func
+
+def _fold_requires_node(world: "ManualWorld", multiworld: MultiWorld, player: int, node: RequiresNode, area: dict) -> RequiresNode:
+    """Replace the calls to option only functions with their result, since the options can't change once rules are set"""
+    if isinstance(node, (RequiresAnd, RequiresOr)):
+        return type(node)(tuple(_fold_requires_node(world, multiworld, player, child, area) for child in node.children))
+
+    if isinstance(node, RequiresNot):
+        return RequiresNot(_fold_requires_node(world, multiworld, player, node.child, area))
+
+    if isinstance(node, RequiresFunction):
+        func = _get_requires_function(node, area)
+        if not getattr(func, "option_only", False):
+            return node
+
+        result = func(world, multiworld, None, player, *node.args)
+
+        if isinstance(result, str):
+            if result == "":
+                return RequiresConstant(True)
+            try:
+                return _fold_requires_node(world, multiworld, player, parse_requires(result), area)
+            except ValueError as e:
+                raise KeyError("Invalid logic format for location/region {}.".format(area)) from e
+
+        return RequiresConstant(bool(result))
+
+    return node
+
+def compile_requires_node(world: "ManualWorld", multiworld: MultiWorld, player: int, node: RequiresNode, area: dict) -> Callable[[CollectionState], bool]:
+    # AND/OR stop at the first operand that decides them, and their operands are already sorted cheapest first
+    if isinstance(node, RequiresAnd):
+        rules = tuple(compile_requires_node(world, multiworld, player, child, area) for child in node.children)
+
+        if len(rules) == 2:
+            first, second = rules
+            return lambda state: first(state) and second(state)
+
+        def and_rule(state: CollectionState) -> bool:
+            for rule in rules:
+                if not rule(state):
+                    return False
             return True
 
-        for item in re.findall(r'\{(\w+)\(([^)]*)\)\}', requires_list):
-            func_name = item[0]
-            func_args = item[1].split(",")
-            if func_args == ['']:
-                func_args.pop()
+        return and_rule
 
-            func = globals().get(func_name)
+    if isinstance(node, RequiresOr):
+        rules = tuple(compile_requires_node(world, multiworld, player, child, area) for child in node.children)
 
-            if func is None:
-                func = getattr(Rules, func_name, None)
+        if len(rules) == 2:
+            first, second = rules
+            return lambda state: first(state) or second(state)
 
-            if not callable(func):
-                raise ValueError(f"Invalid function `{func_name}` in {area}.")
+        def or_rule(state: CollectionState) -> bool:
+            for rule in rules:
+                if rule(state):
+                    return True
+            return False
 
-            result = func(world, multiworld, state, player, *func_args)
-            if isinstance(result, bool):
-                requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "1" if result else "0")
-            else:
-                requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", str(result))
+        return or_rule
+
+    if isinstance(node, RequiresNot):
+        rule = compile_requires_node(world, multiworld, player, node.child, area)
+        return lambda state: not rule(state)
+
+    if isinstance(node, RequiresFunction):
+        return _compile_requires_function(world, multiworld, player, node, area)
+
+    return _compile_requires_item(world, player, node, area)
 
+def _compile_requires_function(world: "ManualWorld", multiworld: MultiWorld, player: int, node: RequiresFunction, area: dict) -> Callable[[CollectionState], bool]:
+    func = _get_requires_function(node, area)
+    args = node.args
 
-        # parse user written statement into list of each item
-        for item in re.findall(r'\|[^|]+\|', requires_list):
-            require_type = 'item'
+    def function_rule(state: CollectionState) -> bool:
+        result = func(world, multiworld, state, player, *args)
+
+        if isinstance(result, bool):
+            return result
+        elif isinstance(result, str):
+            # functions can return a requires string, which is compiled (and cached) the first time it is seen
+            return compile_requires_string(world, multiworld, player, result, area)(state)
+        else:
+            return bool(result)
+
+    return function_rule
+
+def _compile_requires_item(world: "ManualWorld", player: int, node: RequiresItem, area: dict) -> Callable[[CollectionState], bool]:
+    item_name = node.name
+    item_count = node.count
+
+    # validate the count up front, so bad counts are reported when rules are set instead of during fill
+    try:
+        resolve_item_count(item_count, 0)
+    except ValueError as e:
+        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
 
-            if '|@' in item:
-                require_type = 'category'
+    # all/half/% are resolved into a fixed count on first use, once the item pool exists, and kept from then on
+    fixed_count = int(item_count) if item_count.isnumeric() else None
 
-            item_base = item
-            item = item.lstrip('|@$').rstrip('|')
+    if node.category:
+        counter_name = category_counter_name(item_name)
 
-            item_parts = item.split(":")  # type: list[str]
-            item_name = item
-            item_count = "1"
+        # a category that no item belongs to is never satisfied, even when 0 of it is required
+        if not is_category_defined(world, item_name):
+            return _always_false
 
+        if fixed_count is not None:
+            return lambda state: state.has(counter_name, player, fixed_count)
 
-            if len(item_parts) > 1:
-                item_name = item_parts[0].strip()
-                item_count = item_parts[1].strip()
+        def category_rule(state: CollectionState) -> bool:
+            nonlocal fixed_count
+            if fixed_count is None:
+                _, category_count = world.get_category_index().get(item_name, ((), 0))
+                needed = resolve_item_count(item_count, category_count)
+                if not world.get_item_counts():
+                    return state.count(counter_name, player) >= needed
+                fixed_count = needed
 
-            total = 0
+            return state.has(counter_name, player, fixed_count)
 
-            if require_type == 'category':
-                category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-                category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
-                if item_count.lower() == 'all':
-                    item_count = category_items_counts
-                elif item_count.lower() == 'half':
-                    item_count = int(category_items_counts / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(category_items_counts * percent)
+        return category_rule
+
+    if fixed_count is not None:
+        return lambda state: state.has(item_name, player, fixed_count)
+
+    def item_rule(state: CollectionState) -> bool:
+        nonlocal fixed_count
+        if fixed_count is None:
+            items_counts = world.get_item_counts()
+            needed = resolve_item_count(item_count, items_counts.get(item_name, 0))
+            if not items_counts:
+                return state.count(item_name, player) >= needed
+            fixed_count = needed
+
+        return state.has(item_name, player, fixed_count)
+
+    return item_rule
+
+def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
+    # this is only called when the area (think, location or region) has a "requires" field that is a string
+    def checkRequireStringForArea(state: CollectionState, area: dict):
+        requires_list = area["requires"]
+
+        if requires_list == "":
+            return True
+
+        requires_string = infix_to_postfix("".join(evaluateRequireTokens(state, area, tokenize_requires(requires_list))), area)
+        return (evaluate_postfix(requires_string, area))
+
+    # turn the tokens of a requires string into the operands (0 or 1) and operators understood by infix_to_postfix
+    def evaluateRequireTokens(state: CollectionState, area: dict, tokens: Iterable[RequiresToken]) -> list[str]:
+        expression = []
+
+        for token in tokens:
+            if token.kind == token_function:
+                func_name = token.node.name
+                func = globals().get(func_name)
+
+                if func is None:
+                    func = getattr(Rules, func_name, None)
+
+                if not callable(func):
+                    raise ValueError(f"Invalid function `{func_name}` in {area}.")
+
+                result = func(world, multiworld, state, player, *token.node.args)
+                if isinstance(result, bool):
+                    expression.append("1" if result else "0")
                 else:
-                    try:
-                        item_count = int(item_count)
-                    except ValueError as e:
-                        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
-
-                for category_item in category_items:
-                    total += state.count(category_item["name"], player)
-
-                    if total >= item_count:
-                        requires_list = requires_list.replace(item_base, "1")
-            elif require_type == 'item':
-                item_current_count = items_counts.get(item_name, 0)
-                if item_count.lower() == 'all':
-                    item_count = item_current_count
-                elif item_count.lower() == 'half':
-                    item_count = int(item_current_count / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(item_current_count * percent)
+                    # a returned requires string is evaluated in place of the function call
+                    expression.extend(evaluateRequireTokens(state, area, tokenize_requires(str(result))))
+
+            elif token.kind in (token_item, token_category):
+                item_name = token.node.name
+                item_count = getCountTarget(token.node, area)
+
+                if token.kind == token_category:
+                    category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
+                    total = sum([state.count(category_item["name"], player) for category_item in category_items])
                 else:
-                    item_count = int(item_count)
+                    category_items = None
+                    total = state.count(item_name, player)
+
+                # a category that no item belongs to is never satisfied
+                satisfied = total >= item_count and category_items != []
+                expression.append("1" if satisfied else "0")
+
+            elif token.kind == token_constant:
+                expression.append("1" if token.node.value else "0")
+            elif token.kind == token_and:
+                expression.append("&")
+            elif token.kind == token_or:
+                expression.append("|")
+            elif token.kind == token_not:
+                expression.append("!")
+            else:
+                expression.append(token.text)
 
-                total = state.count(item_name, player)
+        return expression
 
-                if total >= item_count:
-                    requires_list = requires_list.replace(item_base, "1")
+    # the number of items each requirement needs, with all/half/% resolved on first use and kept once the item pool exists
+    countTargets = {}
 
-            if total <= item_count:
-                requires_list = requires_list.replace(item_base, "0")
+    def getCountTarget(requirement: RequiresItem, area: dict) -> int:
+        if requirement in countTargets:
+            return countTargets[requirement]
 
-        requires_list = re.sub(r'\s?\bAND\b\s?', '&', requires_list, 0, re.IGNORECASE)
-        requires_list = re.sub(r'\s?\bOR\b\s?', '|', requires_list, 0, re.IGNORECASE)
+        items_counts = world.get_item_counts()
 
-        requires_string = infix_to_postfix("".join(requires_list), area)
-        return (evaluate_postfix(requires_string, area))
+        if requirement.category:
+            category_items = [item for item in world.item_name_to_item.values() if "category" in item and requirement.name in item["category"]]
+            available_count = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
+        else:
+            available_count = items_counts.get(requirement.name, 0)
+
+        try:
+            item_count = resolve_item_count(requirement.count, available_count)
+        except ValueError as e:
+            raise ValueError(f"Invalid item count `{requirement.name}` in {area}.") from e
+
+        if items_counts:
+            countTargets[requirement] = item_count
+        return item_count
 
     # this is only called when the area (think, location or region) has a "requires" field that is a dict
     def checkRequireDictForArea(state: CollectionState, area: dict):
@@ -226,55 +507,94 @@ def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
         else:  # item access is in dict form
             return checkRequireDictForArea(state, area)
 
+    # build the access rule of an area once, either compiled or deferring to the legacy interpreter above
+    def getRuleForArea(area: dict) -> Callable[[CollectionState], bool]:
+        if enable_legacy_rules:
+            return memoize_area_rule(world, multiworld, player, lambda state: fullLocationOrRegionCheck(state, area), area)
+
+        if not area or "requires" not in area.keys() or not area["requires"]:
+            return _always_true
+
+        if isinstance(area["requires"], str):
+            return memoize_area_rule(world, multiworld, player, compile_requires_string(world, multiworld, player, area["requires"], area), area)
+        else:  # item access is in dict form
+            return lambda state: checkRequireDictForArea(state, area)
+
+    # hits and misses of the memoized area rules, see memoize_area_rule
+    world.rule_memo_stats = {"hits": 0, "misses": 0}
+
+    # index of state entry (item name or category counter) -> locations and entrances whose rule reads it
+    world.rule_dependents = {}
+    world.rule_dependents_unknown = set()
+    # the areas whose requires make up the rule of each location and entrance
+    world.rule_areas = {}
+
+    def indexRuleDependencies(spot: Union[Location, Entrance], *areas: dict):
+        world.rule_areas[spot] = tuple(area for area in areas if area and area.get("requires"))
+
+        dependencies = set()
+        for area in areas:
+            area_dependencies = _get_area_dependencies(world, multiworld, player, area)
+            if area_dependencies is None:
+                world.rule_dependents_unknown.add(spot)
+                return
+            dependencies |= area_dependencies
+
+        for name in dependencies:
+            world.rule_dependents.setdefault(name, set()).add(spot)
+
     used_location_names = []
     # Region access rules
+    # A region's requires guard every entrance into it, so AP's cached region reachability already covers them
+    # and the locations inside the region don't have to check them again.
     for region in regionMap.keys():
         used_location_names.extend([l.name for l in multiworld.get_region(region, player).locations])
         if region != "Menu":
-            for exitRegion in multiworld.get_region(region, player).exits:
-                def fullRegionCheck(state: CollectionState, region=regionMap[region]):
-                    return fullLocationOrRegionCheck(state, region)
+            regionRule = getRuleForArea(regionMap[region])
 
-                set_rule(multiworld.get_entrance(exitRegion.name, player), fullRegionCheck)
+            # rules that are always true are left unset, so AP can skip them
+            if regionRule is _always_true:
+                continue
+
+            for entrance in multiworld.get_region(region, player).entrances:
+                set_rule(entrance, regionRule)
+                indexRuleDependencies(entrance, regionMap[region])
 
     # Location access rules
     for location in world.location_table:
         if location["name"] not in used_location_names:
             continue
 
-        locFromWorld = multiworld.get_location(location["name"], player)
-
-        locationRegion = regionMap[location["region"]] if "region" in location else None
-
-        if "requires" in location: # Location has requires, check them alongside the region requires
-            def checkBothLocationAndRegion(state: CollectionState, location=location, region=locationRegion):
-                locationCheck = fullLocationOrRegionCheck(state, location)
-                regionCheck = True # default to true unless there's a region with requires
-
-                if region:
-                    regionCheck = fullLocationOrRegionCheck(state, region)
-
-                return locationCheck and regionCheck
-
-            set_rule(locFromWorld, checkBothLocationAndRegion)
-        elif "region" in location: # Only region access required, check the location's region's requires
-            def fullRegionCheck(state, region=locationRegion):
-                return fullLocationOrRegionCheck(state, region)
+        # No location requires? It's accessible as soon as its region is.
+        if "requires" not in location:
+            continue
 
-            set_rule(locFromWorld, fullRegionCheck)
-        else: # No location region and no location requires? It's accessible.
-            def allRegionsAccessible(state):
-                return True
+        locFromWorld = multiworld.get_location(location["name"], player)
+        locationRule = getRuleForArea(location)
 
-            set_rule(locFromWorld, allRegionsAccessible)
+        if locationRule is not _always_true:
+            set_rule(locFromWorld, locationRule)
+            indexRuleDependencies(locFromWorld, location)
 
     # Victory requirement
     multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
 
+    # the rule each location and entrance ended up with, so rules replaced or wrapped later on (by hooks) can be told apart
+    world.installed_rules = {spot: spot.access_rule for spot in [*multiworld.get_locations(player), *multiworld.get_entrances(player)]}
+
+def index_replaced_rules(world: "ManualWorld"):
+    """Mark every location and entrance whose rule no longer is the one set_rules installed as depending on unknown items,
+    since whatever replaced it (like an after_set_rules hook) can read anything, so get_locations_to_recheck always returns them"""
+    for spot, rule in world.installed_rules.items():
+        if spot.access_rule is not rule:
+            world.rule_dependents_unknown.add(spot)
+
+@option_only_rule
 def YamlEnabled(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int, param: str) -> bool:
     """Is a yaml option enabled?"""
     return is_option_enabled(multiworld, player, param)
 
+@option_only_rule
 def YamlDisabled(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int, param: str) -> bool:
     """Is a yaml option disabled?"""
     return not is_option_enabled(multiworld, player, param)
@@ -1,8 +1,11 @@
 from base64 import b64encode
+import itertools
 import logging
 import os
 import json
-from typing import Callable, Optional
+from collections import Counter
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Optional, Sequence
 
 import Utils
 from worlds.generic.Rules import forbid_items_for_player
@@ -12,28 +15,32 @@ from .Data import item_table, location_table, region_table, category_table, meta
 from .Game import game_name, filler_item_name, starting_items
 from .Meta import world_description, world_webworld, enable_region_diagram
 from .Locations import location_id_to_name, location_name_to_id, location_name_to_location, location_name_groups, victory_names
-from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups
+from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups, item_name_to_counters, state_version_name, get_items_in_categories
 from .DataValidation import runGenerationDataValidation, runPreFillDataValidation
 
 from .Regions import create_regions
 from .Items import ManualItem
-from .Rules import set_rules
+from .Rules import set_rules, get_locations_to_recheck, index_replaced_rules
+from .BatchRules import get_reachable_locations_mask
 from .Options import manual_options_data
-from .Helpers import is_option_enabled, is_item_enabled, get_option_value
+from .Helpers import is_option_enabled, is_item_enabled, get_option_value, get_pool_item_counts, clear_pool_item_counts
 
-from BaseClasses import ItemClassification, Tutorial, Item
+from BaseClasses import ItemClassification, Tutorial, Item, CollectionState, Location
 from Options import PerGameCommonOptions
 from worlds.AutoWorld import World, WebWorld
 
 from .hooks.World import \
     before_create_regions, after_create_regions, \
-    before_create_items_starting, before_create_items_filler, after_create_items, \
+    before_create_items_all, before_create_items_starting, before_create_items_filler, after_create_items, \
     before_create_item, after_create_item, \
     before_set_rules, after_set_rules, \
     before_generate_basic, after_generate_basic, \
     before_fill_slot_data, after_fill_slot_data, before_write_spoiler
 from .hooks.Data import hook_interpret_slot_data
 
+# shared by every state and player, so two states only ever carry the same version if one was copied from the other
+_state_versions = itertools.count(1)
+
 class ManualWorld(World):
     __doc__ = world_description
     game: str = game_name
@@ -54,6 +61,11 @@ class ManualWorld(World):
     item_name_groups = item_name_groups
 
     item_counts = {}
+    category_index = None
+    category_enabled = None
+    unused_category_enabled = None
+    batch_rules = None
+    victory_location_name = None
     start_inventory = {}
 
     location_id_to_name = location_id_to_name
@@ -72,6 +84,8 @@ class ManualWorld(World):
                 regen = True
 
         regen = hook_interpret_slot_data(self, self.player, slot_data) or regen
+        if regen:
+            self.category_enabled = None # the options changed, so categories are enabled again from them
         return regen
 
     @classmethod
@@ -82,14 +96,14 @@ class ManualWorld(World):
     def create_regions(self):
         before_create_regions(self, self.multiworld, self.player)
 
+        # the goal is chosen first, so create_regions only creates the victory location it uses
+        self.victory_location_name = victory_names[get_option_value(self.multiworld, self.player, 'goal')]
+
         create_regions(self, self.multiworld, self.player)
 
-        location_game_complete = self.multiworld.get_location(victory_names[get_option_value(self.multiworld, self.player, 'goal')], self.player)
+        location_game_complete = self.multiworld.get_location(self.victory_location_name, self.player)
         location_game_complete.address = None
 
-        for unused_goal in [self.multiworld.get_location(name, self.player) for name in victory_names if name != location_game_complete.name]:
-            unused_goal.parent_region.locations.remove(unused_goal)
-
         location_game_complete.place_locked_item(
             ManualItem("__Victory__", ItemClassification.progression, None, player=self.player))
 
@@ -100,6 +114,7 @@ class ManualWorld(World):
         pool = []
         traps = []
         configured_item_names = self.item_id_to_name.copy()
+        item_config = {}
 
         for name in configured_item_names.values():
             if name == "__Victory__": continue
@@ -115,11 +130,17 @@ class ManualWorld(World):
                 if not is_item_enabled(self.multiworld, self.player, item):
                     item_count = 0
 
-            if item_count == 0: continue
+            item_config[name] = item_count
 
-            for i in range(item_count):
-                new_item = self.create_item(name)
-                pool.append(new_item)
+        # every count is final before the first item is created, so items the hook drops are never built
+        item_config = before_create_items_all(item_config, self, self.multiworld, self.player)
+
+        for name, item_count in item_config.items():
+            if item_count <= 0: continue
+
+            item = self.item_name_to_item[name]
+
+            pool.extend(self.create_items_of(name, item_count))
 
             if item.get("early"): # only early
                 self.multiworld.early_items[self.player][name] = item_count
@@ -146,11 +167,12 @@ class ManualWorld(World):
 
                 # if the setting lists specific item names, limit the items to just those
                 if "items" in starting_item_block:
-                    items = [item for item in pool if item.name in starting_item_block["items"]]
+                    block_item_names = set(starting_item_block["items"])
+                    items = [item for item in pool if item.name in block_item_names]
 
                 # if the setting lists specific item categories, limit the items to ones that have any of those categories
                 if "item_categories" in starting_item_block:
-                    items_in_categories = [item["name"] for item in self.item_name_to_item.values() if "category" in item and len(set(starting_item_block["item_categories"]).intersection(item["category"])) > 0]
+                    items_in_categories = get_items_in_categories(starting_item_block["item_categories"])
                     items = [item for item in pool if item.name in items_in_categories]
 
                 self.random.shuffle(items)
@@ -173,6 +195,7 @@ class ManualWorld(World):
         # need to put all of the items in the pool so we can have a full state for placement
         # then will remove specific item placements below from the overall pool
         self.multiworld.itempool += pool
+        self.reset_item_counts()
 
     def create_item(self, name: str) -> Item:
         name = before_create_item(name, self, self.multiworld, self.player)
@@ -199,86 +222,145 @@ class ManualWorld(World):
 
         return item_object
 
+    def create_items_of(self, name: str, count: int) -> list[Item]:
+        """creates count copies of an item, only resolving it (and running the item hooks) for the first one\n
+        The other copies are stamped out from the first, keeping anything after_create_item changed on it"""
+        if count <= 0:
+            return []
+
+        first_item = self.create_item(name)
+        item_type = type(first_item)
+        extra_attributes = getattr(first_item, '__dict__', None)
+
+        items = [first_item]
+        for _ in range(count - 1):
+            item_object = item_type(first_item.name, first_item.classification, first_item.code, player=first_item.player)
+            if extra_attributes:
+                item_object.__dict__.update(extra_attributes)
+            items.append(item_object)
+
+        return items
+
+    def collect(self, state: CollectionState, item: Item) -> bool:
+        change = super().collect(state, item)
+        if change:
+            # keep running totals of collected categories and values, so rules can read them in one lookup
+            for counter_name, amount in item_name_to_counters.get(item.name, ()):
+                state.prog_items[self.player][counter_name] += amount
+            state.prog_items[self.player][state_version_name] = next(_state_versions)
+        return change
+
+    def remove(self, state: CollectionState, item: Item) -> bool:
+        held = state.prog_items[self.player][item.name] > 0
+        change = super().remove(state, item)
+        if change and held:
+            for counter_name, amount in item_name_to_counters.get(item.name, ()):
+                state.prog_items[self.player][counter_name] -= amount
+                if state.prog_items[self.player][counter_name] < 1:
+                    del state.prog_items[self.player][counter_name]
+        if change:
+            state.prog_items[self.player][state_version_name] = next(_state_versions)
+        return change
+
     def set_rules(self):
         before_set_rules(self, self.multiworld, self.player)
 
         set_rules(self, self.multiworld, self.player)
 
         after_set_rules(self, self.multiworld, self.player)
+        index_replaced_rules(self)
 
     def generate_basic(self):
         before_generate_basic(self, self.multiworld, self.player)
 
         # Handle item forbidding
         manual_locations_with_forbid = {location['name']: location for location in location_name_to_location.values() if "dont_place_item" in location or "dont_place_item_category" in location}
-        locations_with_forbid = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_forbid.keys()]
+        # nothing is placed between the forbids and the placements below, so one snapshot serves both
+        unfilled_locations = self.get_unfilled_locations()
+        locations_with_forbid = [l for l in unfilled_locations if l.name in manual_locations_with_forbid.keys()]
+        # locations with the same dont_place_item(_category) share one frozenset of forbidden item names
+        forbidden_item_names_by_constraint: dict[tuple[frozenset[str], frozenset[str]], frozenset[str]] = {}
+
         for location in locations_with_forbid:
             manual_location = manual_locations_with_forbid[location.name]
-            forbidden_item_names = []
 
-            if "dont_place_item" in manual_location:
-                if len(manual_location["dont_place_item"]) == 0:
-                    continue
-
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if i["name"] in manual_location["dont_place_item"]])
+            if "dont_place_item" in manual_location and len(manual_location["dont_place_item"]) == 0:
+                continue
 
-            if "dont_place_item_category" in manual_location:
-                if len(manual_location["dont_place_item_category"]) == 0:
-                    continue
+            if "dont_place_item_category" in manual_location and len(manual_location["dont_place_item_category"]) == 0:
+                continue
 
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])])
+            constraint = (frozenset(manual_location.get("dont_place_item", [])), frozenset(manual_location.get("dont_place_item_category", [])))
+            if constraint not in forbidden_item_names_by_constraint:
+                dont_place_item_names, dont_place_categories = constraint
+                forbidden_item_names_by_constraint[constraint] = dont_place_item_names.intersection(item_name_to_item) | get_items_in_categories(sorted(dont_place_categories))
 
+            forbidden_item_names = forbidden_item_names_by_constraint[constraint]
             if len(forbidden_item_names) > 0:
+                # the item rule keeps this frozenset and does a single lookup in it for each item it is asked about,
+                # so it must never be changed once the rule holds it
                 forbid_items_for_player(location, forbidden_item_names, self.player)
-                forbidden_item_names.clear()
 
         # Handle specific item placements using fill_restrictive
         manual_locations_with_placements = {location['name']: location for location in location_name_to_location.values() if "place_item" in location or "place_item_category" in location}
-        locations_with_placements = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_placements.keys()]
+        locations_with_placements = [l for l in unfilled_locations if l.name in manual_locations_with_placements.keys()]
+
+        # index this player's part of the item pool by name and category once, instead of rescanning the whole pool per location
+        pool_by_name: dict[str, list[Item]] = {}
+        pool_names_by_category: dict[str, set[str]] = {}
+        placed_item_ids = set()
+
+        if locations_with_placements:
+            for item in self.multiworld.itempool:
+                if item.player == self.player:
+                    pool_by_name.setdefault(item.name, []).append(item)
+
+            for name in pool_by_name:
+                for category in self.item_name_to_item.get(name, {}).get("category", []):
+                    pool_names_by_category.setdefault(category, set()).add(name)
+
         for location in locations_with_placements:
             manual_location = manual_locations_with_placements[location.name]
-            eligible_items = []
+            eligible_item_names = set()
 
             if "place_item" in manual_location:
                 if len(manual_location["place_item"]) == 0:
                     continue
 
-                eligible_items = [item for item in self.multiworld.itempool if item.name in manual_location["place_item"] and item.player == self.player]
+                eligible_item_names = {name for name in manual_location["place_item"] if pool_by_name.get(name)}
 
-                if len(eligible_items) == 0:
+                if len(eligible_item_names) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match %s." % (manual_location["name"], ", ".join(manual_location["place_item"])))
 
             if "place_item_category" in manual_location:
                 if len(manual_location["place_item_category"]) == 0:
                     continue
 
-                eligible_item_names = [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["place_item_category"])]
-                eligible_items = [item for item in self.multiworld.itempool if item.name in eligible_item_names and item.player == self.player]
+                eligible_item_names = {name for category in manual_location["place_item_category"] for name in pool_names_by_category.get(category, ()) if pool_by_name[name]}
 
-                if len(eligible_items) == 0:
+                if len(eligible_item_names) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match categories %s." % (manual_location["name"], ", ".join(manual_location["place_item_category"])))
 
             if "dont_place_item" in manual_location:
                 if len(manual_location["dont_place_item"]) == 0:
                     continue
 
-                eligible_items = [item for item in eligible_items if item.name not in manual_location["dont_place_item"]]
+                eligible_item_names -= set(manual_location["dont_place_item"])
 
-                if len(eligible_items) == 0:
+                if len(eligible_item_names) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match placed_items(_category) because of forbidden %s." % (manual_location["name"], ", ".join(manual_location["dont_place_item"])))
 
             if "dont_place_item_category" in manual_location:
                 if len(manual_location["dont_place_item_category"]) == 0:
                     continue
 
-                forbidden_item_names = [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])]
-
-                eligible_items = [item for item in eligible_items if item.name not in forbidden_item_names]
+                eligible_item_names -= get_items_in_categories(manual_location["dont_place_item_category"])
 
-                if len(eligible_items) == 0:
+                if len(eligible_item_names) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match placed_items(_category) because of forbidden categories %s." % (manual_location["name"], ", ".join(manual_location["dont_place_item_category"])))
-                forbidden_item_names.clear()
 
+            # every remaining copy is a candidate, in a fixed order so the same seed places the same items
+            eligible_items = [item for name in sorted(eligible_item_names) for item in pool_by_name[name]]
 
             # if we made it here and items is empty, then we encountered an unknown issue... but also can't do anything to place, so error
             if len(eligible_items) == 0:
@@ -288,10 +370,15 @@ class ManualWorld(World):
             location.place_locked_item(item_to_place)
 
             # remove the item we're about to place from the pool so it isn't placed twice
-            self.multiworld.itempool.remove(item_to_place)
+            same_name_items = pool_by_name[item_to_place.name]
+            same_name_items.pop(next(index for index, item in enumerate(same_name_items) if item is item_to_place))
+            placed_item_ids.add(id(item_to_place))
 
+        if placed_item_ids:
+            self.multiworld.itempool[:] = [item for item in self.multiworld.itempool if id(item) not in placed_item_ids]
 
         after_generate_basic(self, self.multiworld, self.player)
+        self.reset_item_counts()
 
         # Enable this in Meta.json to generate a diagram of your manual.  Only works on 0.4.4+
         if enable_region_diagram:
@@ -302,6 +389,10 @@ class ManualWorld(World):
         # DataValidation after all the hooks are done but before fill
         runPreFillDataValidation(self, self.multiworld)
 
+    def post_fill(self):
+        if hasattr(self, 'rule_memo_stats'):
+            logging.debug(f"{self.game} player {self.player} rule memo: {self.rule_memo_stats['hits']} hits, {self.rule_memo_stats['misses']} misses")
+
     def fill_slot_data(self):
         slot_data = before_fill_slot_data({}, self, self.multiworld, self.player)
 
@@ -334,7 +425,7 @@ class ManualWorld(World):
         return self.adjust_filler_items(item_pool, traps)
 
     def adjust_filler_items(self, item_pool, traps):
-        extras = len(self.multiworld.get_unfilled_locations(player=self.player)) - len(item_pool)
+        extras = len(self.get_unfilled_locations()) - len(item_pool)
 
         if extras > 0:
             trap_percent = get_option_value(self.multiworld, self.player, "filler_traps")
@@ -344,13 +435,11 @@ class ManualWorld(World):
             trap_count = extras * trap_percent // 100
             filler_count = extras - trap_count
 
-            for _ in range(0, trap_count):
-                extra_item = self.create_item(self.random.choice(traps))
-                item_pool.append(extra_item)
+            trap_names = Counter(self.random.choice(traps) for _ in range(0, trap_count))
+            for trap_name, count in trap_names.items():
+                item_pool.extend(self.create_items_of(trap_name, count))
 
-            for _ in range(0, filler_count):
-                extra_item = self.create_item(filler_item_name)
-                item_pool.append(extra_item)
+            item_pool.extend(self.create_items_of(filler_item_name, filler_count))
         elif extras < 0:
             logging.warning(f"{self.game} has more items than locations. {abs(extras)} non-progression items will be removed at random.")
             fillers = [item for item in item_pool if item.classification == ItemClassification.filler]
@@ -359,29 +448,101 @@ class ManualWorld(World):
             self.random.shuffle(fillers)
             self.random.shuffle(traps)
             self.random.shuffle(useful)
-            for _ in range(0, abs(extras)):
-                popped = None
-                if fillers:
-                    popped = fillers.pop()
-                elif traps:
-                    popped = traps.pop()
-                elif useful:
-                    popped = useful.pop()
-                else:
-                    logging.warning("Could not remove enough non-progression items from the pool.")
-                    break
-                item_pool.remove(popped)
 
+            # fillers go first, then traps, then useful items
+            removable = fillers[::-1] + traps[::-1] + useful[::-1]
+            if len(removable) < abs(extras):
+                logging.warning("Could not remove enough non-progression items from the pool.")
+
+            self.remove_items_from_pool(item_pool, items=removable[:abs(extras)])
+
+        return item_pool
+
+    def remove_items_from_pool(self, item_pool: list[Item], names: Iterable[str] = (), categories: Iterable[str] = (), items: Iterable[Item] = ()) -> list[Item]:
+        """removes items from item_pool in a single pass and returns it, the list is edited in place\n
+        names: item names to remove one copy of each, repeat a name to remove more copies of it\n
+        categories: categories to remove one item of each, repeat a category to remove more of its items\n
+        items: the exact item objects to remove\n
+        The first matching copies in the pool are the ones removed, and missing items are ignored."""
+        names_to_remove = Counter(names)
+        categories_to_remove = Counter(categories)
+        items_to_remove = {id(item) for item in items}
+        # the batched rules resolved their all/half/% counts against the pool as it was
+        self.batch_rules = None
+
+        kept = []
+        for item in item_pool:
+            if id(item) in items_to_remove:
+                items_to_remove.discard(id(item))
+                continue
+
+            if names_to_remove[item.name] > 0:
+                names_to_remove[item.name] -= 1
+                continue
+
+            if categories_to_remove:
+                category = next((c for c in self.item_name_to_item.get(item.name, {}).get("category", []) if categories_to_remove[c] > 0), None)
+                if category is not None:
+                    categories_to_remove[category] -= 1
+                    continue
+
+            kept.append(item)
+
+        item_pool[:] = kept
         return item_pool
 
+    def get_unfilled_locations(self) -> list[Location]:
+        """returns this world's locations that don't have an item yet, only going through this player's locations"""
+        return [location for location in self.multiworld.get_locations(self.player) if location.item is None]
+
     def get_item_counts(self, player: Optional[int] = None, reset: bool = False) -> dict[str, int]:
-        """returns the player real item count"""
+        """returns the player real item count, or the counts a hook set in item_counts if there are any"""
         if player is None:
             player = self.player
         if not self.item_counts.get(player, {}) or reset:
-            real_pool = self.multiworld.get_items()
-            self.item_counts[player] = {i.name: real_pool.count(i) for i in real_pool if i.player == player}
-        return self.item_counts.get(player)
+            if reset:
+                clear_pool_item_counts(self.multiworld)
+            # a copy, so hooks editing their player's counts don't change the pool counts shared by every slot
+            self.item_counts[player] = dict(get_pool_item_counts(self.multiworld, player))
+        return self.item_counts[player]
+
+    def reset_item_counts(self):
+        """forget the counted item pool of every player and this world's category index and batched rules, after items were added to or removed from the multiworld"""
+        clear_pool_item_counts(self.multiworld)
+        self.category_index = None
+        self.batch_rules = None
+
+    def get_category_index(self, reset: bool = False) -> Mapping[str, tuple[tuple[str, ...], int]]:
+        """returns an immutable index of category name -> (names of the items in it, count of those items in the player's pool)"""
+        if self.category_index is None or reset:
+            items_counts = self.get_item_counts(reset=reset)
+
+            category_items = {}
+            for item in self.item_name_to_item.values():
+                for category in dict.fromkeys(item.get("category", [])):
+                    category_items.setdefault(category, []).append(item["name"])
+
+            category_index = MappingProxyType({
+                category: (tuple(names), sum(items_counts.get(name, 0) for name in names))
+                for category, names in category_items.items()
+            })
+
+            # don't keep an index built before the item pool exists
+            if not items_counts:
+                return category_index
+
+            self.category_index = category_index
+        return self.category_index
+
+    def get_locations_to_recheck(self, items: list[Item]) -> set:
+        """returns the locations whose reachability may have changed after collecting (or removing) the given items,
+        so trackers or custom sweeps don't have to rescan every location"""
+        return get_locations_to_recheck(self, items)
+
+    def get_reachable_locations_mask(self, state: CollectionState) -> tuple[list[Location], Sequence[bool]]:
+        """returns every location of this world and whether each can be reached with the given state, evaluated in one batch\n
+        the mask is a numpy array when numpy is installed, and a list otherwise"""
+        return get_reachable_locations_mask(self, state)
 
     def client_data(self):
         return {
@@ -5,74 +5,54 @@ from ..Locations import ManualLocation
 from ..Items import ManualItem
 
 
+# which of the Easy/Medium/Hard categories each choice of the select_difficulty option includes
+difficulties_by_selection = {
+    0: {"Easy"},
+    1: {"Medium"},
+    2: {"Hard"},
+    3: {"Easy", "Medium"},
+    4: {"Easy", "Hard"},
+    5: {"Medium", "Hard"},
+    6: {"Easy", "Medium", "Hard"},
+}
+
+# Use this if you want to override the default behavior of is_option_enabled for many categories at once
+# It is called once per player with every category name, and its result is kept for the rest of generation
+# Return a dict of category name -> True to enable or False to disable it, categories left out use before_is_category_enabled
+def before_are_categories_enabled(multiworld: MultiWorld, player: int, category_names: list[str]) -> dict[str, bool]:
+    category_enabled = {}
+
+    selection = Helpers.get_option_value(multiworld, player, "select_difficulty")
+    if selection in difficulties_by_selection:
+        for difficulty in ("Easy", "Medium", "Hard"):
+            category_enabled[difficulty] = difficulty in difficulties_by_selection[selection]
+
+    turbo_track = Helpers.get_option_value(multiworld, player, "include_turbo_track") == 1
+    category_enabled["TTrack"] = turbo_track
+    category_enabled["Track - Turbo Track"] = turbo_track
+
+    cups = Helpers.get_option_value(multiworld, player, "include_cups") == 1
+    category_enabled["Cups"] = cups
+    category_enabled["Cups_option"] = cups
+    category_enabled["Cups Items"] = Helpers.get_option_value(multiworld, player, "cups_unlock_method") == 1
+
+    time_trial = Helpers.get_option_value(multiworld, player, "include_time_trial") == 1
+    ghosts = Helpers.get_option_value(multiworld, player, "included_ghosts")
+    category_enabled["Time Trial"] = time_trial
+    category_enabled["Time Trial_option"] = time_trial
+    category_enabled["N. Tropy"] = time_trial and ghosts == 1
+    category_enabled["N. Tropy Loc"] = time_trial and ghosts >= 1
+    category_enabled["N. Oxide"] = time_trial and ghosts == 2
+
+    character_rando = Helpers.get_option_value(multiworld, player, "character_rando")
+    category_enabled["Characters"] = character_rando == 1 or character_rando == 2
+    category_enabled["Unlockable"] = character_rando == 2
+
+    return category_enabled
+
 # Use this if you want to override the default behavior of is_option_enabled
 # Return True to enable the category, False to disable it, or None to use the default behavior
 def before_is_category_enabled(multiworld: MultiWorld, player: int, category_name: str) -> Optional[bool]:
-    if category_name == "Easy" or category_name == "Medium" or category_name == "Hard":
-        selection = Helpers.get_option_value(multiworld, player, "select_difficulty")
-        if category_name == "Easy":
-            if selection == 0 or selection == 3 or selection == 4 or selection == 6:
-                return True
-            elif selection == 1 or selection == 2 or selection == 5:
-                return False
-        if category_name == "Medium":
-            if selection == 1 or selection == 3 or selection == 5 or selection == 6:
-                return True
-            elif selection == 0 or selection == 2 or selection == 4:
-                return False
-        if category_name == "Hard":
-            if selection == 2 or selection == 4 or selection == 5 or selection == 6:
-                return True
-            elif selection == 0 or selection == 1 or selection == 3:
-                return False
-    if category_name == "TTrack" or category_name == "Track - Turbo Track":
-        if Helpers.get_option_value(multiworld, player, "include_turbo_track") == 1:
-            return True
-        else:
-            return False
-    if category_name == "Cups" or category_name == "Cups_option":
-        if Helpers.get_option_value(multiworld, player, "include_cups") == 1:
-            return True
-        else:
-            return False
-    if category_name == "Cups Items":
-        if Helpers.get_option_value(multiworld, player, "cups_unlock_method") == 1:
-            return True
-        else:
-            return False
-    if category_name == "Time Trial" or category_name == "Time Trial_option":
-        if Helpers.get_option_value(multiworld, player, "include_time_trial") == 1:
-            return True
-        else:
-            return False
-    if category_name == "N. Tropy":
-        if Helpers.get_option_value(multiworld, player, "include_time_trial") == 1:
-            if Helpers.get_option_value(multiworld, player, "included_ghosts") == 1:
-                return True
-        return False
-    if category_name == "N. Tropy Loc":
-        if Helpers.get_option_value(multiworld, player, "include_time_trial") == 1:
-            if Helpers.get_option_value(multiworld, player, "included_ghosts") >= 1:
-                return True
-        return False
-    if category_name == "N. Oxide":
-        if Helpers.get_option_value(multiworld, player, "include_time_trial") == 1:
-            if Helpers.get_option_value(multiworld, player, "included_ghosts") == 2:
-                return True
-        return False
-    if category_name == "Characters" or category_name == "Unlockable":
-        selection = Helpers.get_option_value(multiworld, player, "character_rando")
-        if category_name == "Characters":
-            if selection == 1 or selection == 2:
-                return True
-            else:
-                return False
-        if category_name == "Unlockable":
-            if selection == 2:
-                return True
-            else:
-                return False
-            
     return None
 
 # Use this if you want to override the default behavior of is_option_enabled
@@ -1,6 +1,7 @@
 from typing import Optional
 from worlds.AutoWorld import World
-from ..Helpers import clamp, get_items_with_value
+from ..Helpers import clamp
+from ..Items import value_counter_name
 from BaseClasses import MultiWorld, CollectionState
 
 import re
@@ -34,34 +35,18 @@ def ItemValue(world: World, multiworld: MultiWorld, state: CollectionState, play
     eg. {ItemValue(Coins:12)} will check if the player has collect at least 12 coins worth of items
     """
 
-    args_list = args.split(":")
-    if not len(args_list) == 2 or not args_list[1].isnumeric():
-        raise Exception(f"ItemValue needs a number after : so it looks something like 'ItemValue({args_list[0]}:12)'")
-    args_list[0] = args_list[0].lower().strip()
-    args_list[1] = int(args_list[1].strip())
-
-    if not hasattr(world, 'item_values_cache'): #Cache made for optimization purposes
-        world.item_values_cache = {}
-
-    if not world.item_values_cache.get(player, {}):
-        world.item_values_cache[player] = {
-            'state': {},
-            'count': {},
-            }
-
-    if (args_list[0] not in world.item_values_cache[player].get('count', {}).keys()
-            or world.item_values_cache[player].get('state') != dict(state.prog_items[player])):
-        #Run First Time or if state changed since last check
-        existing_item_values = get_items_with_value(world, multiworld, args_list[0])
-        total_Count = 0
-        for name, value in existing_item_values.items():
-            count = state.count(name, player)
-            if count > 0:
-                total_Count += count * value
-        world.item_values_cache[player]['count'][args_list[0]] = total_Count
-        world.item_values_cache[player]['state'] = dict(state.prog_items[player]) #save the current gotten items to check later if its the same
-    return world.item_values_cache[player]['count'][args_list[0]] >= args_list[1]
+    if args not in _item_value_args:
+        args_list = args.split(":")
+        if not len(args_list) == 2 or not args_list[1].isnumeric():
+            raise Exception(f"ItemValue needs a number after : so it looks something like 'ItemValue({args_list[0]}:12)'")
+        _item_value_args[args] = (value_counter_name(args_list[0]), int(args_list[1].strip()))
 
+    # the running value totals are kept up to date by ManualWorld.collect/remove
+    counter_name, needed = _item_value_args[args]
+    return state.count(counter_name, player) >= needed
+
+# ItemValue args -> (name of the value's state counter, value needed), parsed once per distinct args
+_item_value_args: dict[str, tuple[str, int]] = {}
 
 # Two useful functions to make require work if an item is disabled instead of making it inaccessible
 def OptOne(world: World, multiworld: MultiWorld, state: CollectionState, player: int, item: str, items_counts: Optional[dict] = None):
@@ -92,8 +77,7 @@ def OptOne(world: World, multiworld: MultiWorld, state: CollectionState, player:
     if require_type == 'category':
         if item_count.isnumeric():
             #Only loop if we can use the result to clamp
-            category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-            category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
+            _, category_items_counts = world.get_category_index().get(item_name, ((), 0))
             item_count = clamp(int(item_count), 0, category_items_counts)
         return f"|@{item_name}:{item_count}|"
     elif require_type == 'item':
@@ -81,20 +81,9 @@ def after_create_regions(world: World, multiworld: MultiWorld, player: int):
     if hasattr(multiworld, "clear_location_cache"):
         multiworld.clear_location_cache()
 
-# The item pool before starting items are processed, in case you want to see the raw item pool at that stage
-def before_create_items_starting(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
-    return item_pool
-
-# The item pool after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
-def before_create_items_filler(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
-    # Use this hook to remove items from the item pool
-    itemNamesToRemove = [] # List of item names
-
-    # Add your code here to calculate which items to remove.
-    #
-    # Because multiple copies of an item can exist, you need to add an item name
-    # to the list multiple times if you want to remove multiple copies of it.
-    
+# The number of copies of each item (name -> count), before any item is created, in case you want to change how many copies of an item are made
+# Items disabled by their categories already have a count of 0, and items left at 0 (or removed from the dict) are not created
+def before_create_items_all(item_config: dict[str, int], world: World, multiworld: MultiWorld, player: int) -> dict[str, int]:
     # Get Trophy Information
     tracks = 17
     if is_category_enabled(multiworld, player, "Track - Turbo Track") is True:
@@ -115,14 +104,27 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
 
     max_trophies = round((tracks * 3 * difficulties) - tracks - (difficulties * tracks / 3)) + tt
 
-    # Remove the excess Trophy items
-    bad_trophies = 173-max_trophies
-    for i in range(bad_trophies):
-        itemNamesToRemove.append("Trophy")
+    # Only create as many Trophy items as there are trophies to win
+    bad_trophies = max(173 - max_trophies, 0)
+    item_config["Trophy"] = max(item_config.get("Trophy", 0) - bad_trophies, 0)
+
+    return item_config
+
+# The item pool before starting items are processed, in case you want to see the raw item pool at that stage
+def before_create_items_starting(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+    return item_pool
+
+# The item pool after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
+def before_create_items_filler(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+    # Use this hook to remove items from the item pool
+    itemNamesToRemove = [] # List of item names
+
+    # Add your code here to calculate which items to remove.
+    #
+    # Because multiple copies of an item can exist, you need to add an item name
+    # to the list multiple times if you want to remove multiple copies of it.
 
-    for itemName in itemNamesToRemove:
-        item = next(i for i in item_pool if i.name == itemName)
-        item_pool.remove(item)
+    world.remove_items_from_pool(item_pool, names=itemNamesToRemove)
 
     return item_pool
 
@@ -1,6 +1,145 @@
+import itertools
+import unittest
+
 from test.TestBase import WorldTestBase
 from .Game import game_name
+from .Requires import RequiresItem, RequiresFunction, RequiresAnd, RequiresOr, RequiresNot, RequiresConstant, RequiresNode, \
+    parse_requires, simplify_requires, order_requires, tokenize_requires, term_token_kinds, token_and, token_or, token_not
+from .Rules import infix_to_postfix, evaluate_postfix
+from .hooks.World import before_create_items_all
 
 
 class ManualTest(WorldTestBase):
     game = game_name
+
+    def test_create_items_of(self):
+        items = self.world.create_items_of("Trophy", 3)
+
+        self.assertEqual(len(items), 3)
+        self.assertEqual(len({id(item) for item in items}), 3)
+        for item in items:
+            self.assertEqual((item.name, item.player, item.code, item.classification), (items[0].name, self.player, items[0].code, items[0].classification))
+
+        self.assertEqual(self.world.create_items_of("Trophy", 0), [])
+
+    def test_remove_items_from_pool(self):
+        trophies = [self.world.create_item("Trophy") for _ in range(3)]
+        crash_cove = self.world.create_item("Crash Cove")
+        mystery_caves = self.world.create_item("Mystery Caves")
+        pool = trophies + [crash_cove, mystery_caves]
+
+        # the list is edited in place, names and categories remove their first copies and missing items are ignored
+        result = self.world.remove_items_from_pool(pool, names=["Trophy", "Trophy", "Not An Item"], categories=["Tracks"])
+        self.assertIs(result, pool)
+        self.assertEqual([id(item) for item in pool], [id(trophies[2]), id(mystery_caves)])
+
+        self.world.remove_items_from_pool(pool, items=[mystery_caves])
+        self.assertEqual([id(item) for item in pool], [id(trophies[2])])
+
+
+class TrophyCountTest(WorldTestBase):
+    game = game_name
+    options = {
+        "select_difficulty": 6, # all
+        "include_turbo_track": 1,
+        "include_cups": 1,
+        "include_time_trial": 0,
+    }
+
+    def test_before_create_items_all(self):
+        # 22 tracks (17 + Turbo Track + 4 cups) over 3 difficulties: round(22 * 3 * 3 - 22 - 3 * 22 / 3) = 154 of the 173 trophies
+        item_config = before_create_items_all({"Trophy": 173, "Crash Cove": 1}, self.world, self.multiworld, self.player)
+        self.assertEqual(item_config, {"Trophy": 154, "Crash Cove": 1})
+
+    def test_before_create_items_all_never_negative(self):
+        # fewer trophies than there are to remove leaves none, and a missing count stays at none
+        self.assertEqual(before_create_items_all({"Trophy": 10}, self.world, self.multiworld, self.player)["Trophy"], 0)
+        self.assertEqual(before_create_items_all({}, self.world, self.multiworld, self.player)["Trophy"], 0)
+
+
+def evaluate_tree(node: RequiresNode, truth: dict) -> bool:
+    if isinstance(node, RequiresAnd):
+        return all(evaluate_tree(child, truth) for child in node.children)
+    if isinstance(node, RequiresOr):
+        return any(evaluate_tree(child, truth) for child in node.children)
+    if isinstance(node, RequiresNot):
+        return not evaluate_tree(node.child, truth)
+    if isinstance(node, RequiresConstant):
+        return node.value
+    return truth[node]
+
+def evaluate_legacy(requires: str, truth: dict) -> bool:
+    """Evaluate a requires string the way the legacy interpreter does, as a 1/0 expression in postfix"""
+    expression = ""
+    for token in tokenize_requires(requires):
+        if token.kind in term_token_kinds:
+            expression += "1" if evaluate_tree(token.node, truth) else "0"
+        elif token.kind == token_and:
+            expression += "&"
+        elif token.kind == token_or:
+            expression += "|"
+        elif token.kind == token_not:
+            expression += "!"
+        else:
+            expression += token.text
+    return evaluate_postfix(infix_to_postfix(expression, requires), requires)
+
+
+class RequiresTest(unittest.TestCase):
+    requires_strings = [
+        "|A|",
+        "|A| OR |B| AND |C|",
+        "|A| AND |B| OR |C|",
+        "|A| and (|B| or (|C| AND !|D|))",
+        "!(|A| OR |B|) OR |@Cat:all|",
+        "((|A|) AND ((|B| OR |C|)))",
+        "{Func(|Item|)} AND |A:2| OR !{Other()}",
+        "(|A| AND 1) OR 0 AND |B|",
+        "!|A| OR !(0)",
+    ]
+
+    def assertMatchesLegacy(self, requires: str, node: RequiresNode):
+        terms = list(dict.fromkeys(token.node for token in tokenize_requires(requires) if token.kind in term_token_kinds and not isinstance(token.node, RequiresConstant)))
+
+        for values in itertools.product((False, True), repeat=len(terms)):
+            truth = dict(zip(terms, values))
+            with self.subTest(requires=requires, truth=truth):
+                self.assertEqual(evaluate_tree(node, truth), evaluate_legacy(requires, truth))
+
+    def test_parse_matches_legacy(self):
+        for requires in self.requires_strings:
+            self.assertMatchesLegacy(requires, parse_requires(requires))
+
+    def test_simplify_and_order_keep_meaning(self):
+        for requires in self.requires_strings:
+            tree = parse_requires(requires)
+            self.assertMatchesLegacy(requires, simplify_requires(tree))
+            self.assertMatchesLegacy(requires, order_requires(simplify_requires(tree)))
+
+    def test_and_or_read_left_to_right(self):
+        a, b, c = RequiresItem("A"), RequiresItem("B"), RequiresItem("C")
+
+        self.assertEqual(parse_requires("|A| OR |B| AND |C|"), RequiresAnd((RequiresOr((a, b)), c)))
+        self.assertEqual(parse_requires("|A| AND |B| OR |C|"), RequiresOr((RequiresAnd((a, b)), c)))
+        self.assertEqual(parse_requires("|A| AND (|B| OR |C|)"), RequiresAnd((a, RequiresOr((b, c)))))
+
+    def test_parse_terms(self):
+        self.assertEqual(parse_requires("|@Cat:all|"), RequiresItem("Cat", "all", True))
+        self.assertEqual(parse_requires("|A:2|"), RequiresItem("A", "2"))
+        self.assertEqual(parse_requires("{Func(|Item|)}"), RequiresFunction("Func", ("|Item|",), "|Item|"))
+        self.assertEqual(parse_requires("!|A|"), RequiresNot(RequiresItem("A")))
+
+    def test_simplify_constants(self):
+        self.assertEqual(simplify_requires(parse_requires("|A| AND 0")), RequiresConstant(False))
+        self.assertEqual(simplify_requires(parse_requires("|A| OR 1")), RequiresConstant(True))
+        self.assertEqual(simplify_requires(parse_requires("|A| AND 1")), RequiresItem("A"))
+        self.assertEqual(simplify_requires(parse_requires("!0")), RequiresConstant(True))
+
+    def test_order_puts_cheap_operands_first(self):
+        tree = order_requires(parse_requires("{Func()} AND |@Cat| AND |A|"))
+        self.assertEqual(tree, RequiresAnd((RequiresItem("A"), RequiresItem("Cat", "1", True), RequiresFunction("Func"))))
+
+    def test_malformed_requires(self):
+        for requires in ["", "|A| AND", "(|A| OR |B|", "|A| OR |B|)", "|A| |B|", "AND |A|", "!"]:
+            with self.subTest(requires=requires):
+                self.assertRaises(ValueError, parse_requires, requires)